@@ -0,0 +1,52 @@
+"""مكعب تجميع عدد المنشآت حسب المحافظة والمدينة والفئة والحالة"""
+import copy
+from collections import Counter
+
+import pandas as pd
+
+# القيمة المعروضة للخلايا الفارغة
+MISSING_VALUE = 'غير محدد'
+
+
+def _cell_value(value):
+    """قيمة البعد كنص أو "غير محدد" للقيم الفارغة"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return MISSING_VALUE
+    return str(value).strip() or MISSING_VALUE
+
+
+class AggregationCube:
+    """عدد الصفوف لكل تركيبة من قيم الأبعاد، يُحسب مرة واحدة لكل نسخة من البيانات
+
+    عند تغير بعض الصفوف تُطرح تركيبات الصفوف المحذوفة وتُضاف تركيبات الصفوف
+    الجديدة بدلاً من تجميع الجدول من جديد. المكعب صغير (عدد التركيبات الموجودة
+    فقط) فتكون التجميعات والرسوم عليه فورية.
+    """
+
+    def __init__(self, columns_values):
+        self.counts = Counter(self._cells(columns_values))
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    @staticmethod
+    def _cells(columns_values):
+        """تركيبة قيم الأبعاد لكل صف"""
+        return zip(*[[_cell_value(value) for value in values] for values in columns_values])
+
+    def updated(self, removed_labels, removed_columns, added_labels, added_columns):
+        """نسخة جديدة من المكعب بعد حذف وإضافة الصفوف المتغيرة فقط"""
+        cube = copy.copy(self)
+        counts = Counter(self.counts)
+        counts.subtract(self._cells(removed_columns))
+        counts.update(self._cells(added_columns))
+        # حذف التركيبات التي لم يعد لها صفوف
+        cube.counts = +counts
+        return cube
+
+    def frame(self, dimensions, count_column='العدد'):
+        """المكعب كجدول صغير: عمود لكل بعد وعمود للعدد"""
+        return pd.DataFrame(
+            [cell + (count,) for cell, count in self.counts.items()],
+            columns=list(dimensions) + [count_column]
+        )
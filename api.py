@@ -0,0 +1,226 @@
+"""واجهة JSON خفيفة للتحقق من أكواد المنشآت من الأنظمة الأخرى (الماسحات والتطبيقات)
+
+تعمل داخل عملية التطبيق hotel.py عند تحديد المتغير FOOD_SAFETY_API_PORT فتجيب
+من نفس نسخة البيانات وفهرس الأكواد المحملين في الذاكرة، أو كعملية مستقلة:
+    python api.py --port 8600
+
+    GET  /facility/<code>                    منشآت الكود (404 إذا لم يوجد)
+    POST /facilities   {"codes": [...]}      عدة أكواد في طلب واحد
+    GET  /health                             نسخة البيانات الحالية
+"""
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+
+from cards import card_columns
+from data_store import DATA_SOURCES, SnapshotStore, DatasetRefresher
+from schema import resolve_schema
+from search_index import CodeIndex
+
+# منفذ الواجهة داخل التطبيق (بدون قيمة لا تعمل الواجهة)
+API_PORT = os.environ.get("FOOD_SAFETY_API_PORT")
+# أكبر عدد أكواد في طلب واحد
+MAX_BATCH_CODES = 10000
+# أكبر حجم لجسم الطلب بالبايت
+MAX_BODY_BYTES = 4 * 2 ** 20
+# أقصى انتظار لأول تحميل للبيانات قبل الرد بأن الخدمة غير متاحة
+DATA_WAIT_SECONDS = 10
+# حقول كل منشأة في الرد
+FACILITY_FIELDS = ('code', 'name', 'status', 'address')
+
+
+def lookup_sources(dataset):
+    """فهرس الكود وعمود الكود وأعمدة البطاقات لنسخة البيانات عند تشغيل الواجهة مستقلة"""
+    schema = dataset.artifact(('schema', (), None), lambda: resolve_schema(dataset.data))
+    search_column = schema.search_column
+    code_index = dataset.artifact(
+        ('code_index', search_column),
+        lambda: CodeIndex(dataset.data[search_column].tolist(), dataset.data.index)
+    )
+    cards = dataset.artifact(('card_columns', schema.key), lambda: card_columns(dataset.data, schema))
+    return code_index, dataset.data[search_column], cards
+
+
+def _json_values(series):
+    """قيم العمود كمصفوفة نصوص مع None للقيم الفارغة (JSON لا يقبل NaN)"""
+    values = series.astype(object)
+    return np.where(values.isna(), None, values.astype(str))
+
+
+def api_columns(dataset, sources=lookup_sources):
+    """فهرس الكود ومعرّفات الصفوف وحقول الرد كمصفوفات جاهزة (مرة واحدة لكل نسخة)
+
+    الطلب بعدها يحوّل معرّفات الصفوف المطابقة إلى مواقع ويأخذ القيم من
+    المصفوفات مباشرة بدلاً من عمليات pandas على كل طلب.
+    """
+    def build():
+        code_index, code_values, cards = sources(dataset)
+        columns = [code_values.reindex(cards.index)] + [
+            cards[col] for col in ('display_name', 'status_class', 'full_address')
+        ]
+        return code_index, cards.index, [_json_values(column) for column in columns]
+    return dataset.artifact('api_columns', build)
+
+
+class FacilityAPI:
+    """خادم HTTP في خيط خلفي يجيب من النسخة الحالية لخيط تحديث البيانات
+
+    كل طلب يطابق الأكواد في قاموس فهرس الكود ثم يقرأ الاسم والحالة والعنوان
+    من أعمدة البطاقات المحسوبة مسبقاً بعملية loc واحدة لجميع الصفوف المطابقة.
+    """
+
+    def __init__(self, refresher, sources=lookup_sources, host='0.0.0.0', port=8600):
+        self.refresher = refresher
+        self.sources = sources
+        handler = type('FacilityHandler', (_FacilityHandler,), {'api': self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        """عنوان ومنفذ الخادم"""
+        return self._server.server_address
+
+    def start(self):
+        """تشغيل الخادم في خيط خلفي"""
+        self._thread = threading.Thread(target=self.serve_forever, name="facility-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """تشغيل الخادم في الخيط الحالي حتى إيقافه"""
+        self._server.serve_forever()
+
+    def stop(self):
+        """إيقاف الخادم"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def dataset(self):
+        """النسخة الحالية من البيانات (None إذا لم تُحمل بعد أو كانت فارغة)"""
+        dataset = self.refresher.current(timeout=DATA_WAIT_SECONDS)
+        if dataset is None or dataset.data.empty:
+            return None
+        return dataset
+
+    def find(self, dataset, codes):
+        """نتيجة كل كود: هل وُجد ومنشآته (الكود والاسم والحالة والعنوان)"""
+        code_index, row_index, columns = api_columns(dataset, self.sources)
+        matches = [code_index.exact(code) for code in codes]
+        positions = row_index.get_indexer([label for labels in matches for label in labels])
+        facilities = [
+            dict(zip(FACILITY_FIELDS, row)) for row in zip(*[column[positions].tolist() for column in columns])
+        ]
+        results = []
+        position = 0
+        for code, labels in zip(codes, matches):
+            results.append({
+                'query': code,
+                'found': bool(labels),
+                'facilities': facilities[position:position + len(labels)],
+            })
+            position += len(labels)
+        return results
+
+
+class _FacilityHandler(BaseHTTPRequestHandler):
+    """معالجة طلبات الواجهة (الخاصية api تُحدد لكل خادم)"""
+
+    api = None
+    protocol_version = 'HTTP/1.1'
+    # الرد يُكتب على دفعتين (العناوين ثم الجسم)، وبدون هذا ينتظر الاتصال المستمر ~40ms
+    disable_nagle_algorithm = True
+
+    def _send(self, status, payload):
+        """إرسال رد JSON"""
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dataset(self):
+        """النسخة الحالية من البيانات أو رد 503 إذا لم تكن متاحة"""
+        dataset = self.api.dataset()
+        if dataset is None:
+            self._send(503, {'error': 'data not loaded yet'})
+        return dataset
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            dataset = self._dataset()
+            if dataset is not None:
+                self._send(200, {'version': dataset.version, 'rows': len(dataset.data)})
+            return
+        if not path.startswith('/facility/'):
+            self._send(404, {'error': 'not found'})
+            return
+        code = unquote(path[len('/facility/'):])
+        dataset = self._dataset()
+        if dataset is None:
+            return
+        result = self.api.find(dataset, [code])[0]
+        self._send(200 if result['found'] else 404, {'version': dataset.version, **result})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/facilities':
+            self._send(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            self._send(413, {'error': f'body must be at most {MAX_BODY_BYTES} bytes'})
+            self.close_connection = True
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b'null')
+            codes = body.get('codes') if isinstance(body, dict) else body
+            if not isinstance(codes, list):
+                raise ValueError
+        except ValueError:
+            self._send(400, {'error': 'expected JSON body {"codes": [...]}'})
+            return
+        if len(codes) > MAX_BATCH_CODES:
+            self._send(413, {'error': f'at most {MAX_BATCH_CODES} codes per request'})
+            return
+        dataset = self._dataset()
+        if dataset is None:
+            return
+        codes = [str(code) for code in codes]
+        self._send(200, {'version': dataset.version, 'results': self.api.find(dataset, codes)})
+
+    def log_message(self, format, *args):
+        # بدون سطر في السجل لكل طلب (آلاف الطلبات في الدقيقة من الماسحات)
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=DATA_SOURCES, help="رابط أو مسار ملف البيانات (افتراضياً مصادر FOOD_SAFETY_SOURCES)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(API_PORT or 8600))
+    parser.add_argument('--interval', type=int, default=300, help="الفترة بين تحديثات البيانات بالثواني")
+    args = parser.parse_args()
+
+    # تجهيز الفهرس لكل نسخة جديدة في خيط التحديث قبل إتاحتها للطلبات
+    refresher = DatasetRefresher(args.source, SnapshotStore(), interval=args.interval, warmup=api_columns)
+    api = FacilityAPI(refresher.start(), host=args.host, port=args.port)
+    print(f"serving on http://{args.host}:{args.port}")
+    try:
+        api.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ import json
 from urllib.parse import urlparse
 from datetime import datetime
 
+from data_store import DATA_SOURCES, fetch_sheet
+
 # إعداد الصفحة
 st.set_page_config(
     page_title="الهيئة القومية لسلامة الغذاء",
@@ -149,14 +151,8 @@ else:
 def load_data():
     """تحميل البيانات من Google Sheets"""
     try:
-        # الرابط الجديد
-        sheet_url = "https://docs.google.com/spreadsheets/d/1EN0muIIOrV5tqRoY02SX2Q5DdRFEM_CGo1Es4xueCgA/edit?usp=scv"
-        data = pd.read_csv(sheet_url)
-        
-        # تنظيف أسماء الأعمدةcsv
-        data.columns = data.columns.str.strip()
-        
-        return data
+        # نفس مصادر البيانات وطريقة تحميلها في hotel.py (ملف واحد أو ملف لكل مديرية)
+        return fetch_sheet(DATA_SOURCES)
         
     except Exception as e:
         st.error(f"❌ خطأ في تحميل البيانات: {e}")
@@ -0,0 +1,32 @@
+"""توحيد النصوص العربية قبل الفهرسة والبحث"""
+import re
+
+# جدول تحويل الحروف: توحيد الألف والهمزات والتاء المربوطة والألف المقصورة
+# وتحويل الأرقام العربية الهندية إلى أرقام لاتينية
+_CHAR_MAP = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و', 'ئ': 'ي',
+    'ة': 'ه',
+    'ى': 'ي',
+}
+for _digit in range(10):
+    _CHAR_MAP[chr(0x0660 + _digit)] = str(_digit)  # ٠ - ٩
+    _CHAR_MAP[chr(0x06F0 + _digit)] = str(_digit)  # ۰ - ۹
+# حذف التشكيل والتطويل
+for _mark in list(range(0x064B, 0x0653)) + [0x0670, 0x0640]:
+    _CHAR_MAP[chr(_mark)] = None
+
+_TRANSLATION = str.maketrans(_CHAR_MAP)
+_SPACES = re.compile(r'\s+')
+_TOKEN = re.compile(r'\w+')
+
+
+def normalize_arabic(text):
+    """توحيد أشكال الحروف العربية وإزالة التشكيل والمسافات الزائدة"""
+    text = text.translate(_TRANSLATION).casefold()
+    return _SPACES.sub(' ', text).strip()
+
+
+def tokenize(text):
+    """تقسيم النص الموحد إلى كلمات"""
+    return _TOKEN.findall(text)
@@ -0,0 +1,59 @@
+"""التحقق من قائمة أكواد كاملة دفعة واحدة بربطها بجدول أكواد نسخة البيانات"""
+import io
+import re
+
+import pandas as pd
+
+from schema import SEARCH_COLUMN_CANDIDATES
+from search_index import normalize_code
+
+# الفواصل المسموحة بين الأكواد الملصوقة: أسطر ومسافات وفواصل
+_CODE_SEPARATORS = re.compile(r'[\s,;،؛]+')
+
+
+def parse_code_text(text):
+    """قائمة الأكواد من نص ملصوق"""
+    return [code for code in _CODE_SEPARATORS.split(text or '') if code]
+
+
+def read_code_file(name, content):
+    """قراءة الأكواد من ملف CSV أو Excel (xlsx): عمود الكود إن وجد وإلا العمود الأول
+
+    ملفات Excel تحتاج مكتبة openpyxl (يظهر ImportError إذا لم تكن مثبتة).
+    """
+    if name.lower().endswith('.xlsx'):
+        read = lambda header: pd.read_excel(io.BytesIO(content), dtype=str, header=header)
+    else:
+        read = lambda header: pd.read_csv(io.BytesIO(content), dtype=str, header=header)
+    table = read(0)
+    table.columns = table.columns.astype(str).str.strip()
+    column = next((col for col in table.columns if col in SEARCH_COLUMN_CANDIDATES), None)
+    if column is None:
+        # ملف بدون عناوين: السطر الأول كود أيضاً
+        table = read(None)
+        column = table.columns[0]
+    return table[column].dropna().tolist()
+
+
+def code_lookup_table(code_index, codes, cards):
+    """جدول الربط لنسخة البيانات: الكود الموحد مع الكود الأصلي والاسم والحالة والعنوان"""
+    keys = pd.Series(code_index.keys, dtype=object)
+    keys = keys[keys != '']
+    table = cards.loc[keys.index].reset_index(drop=True)
+    # المصفوفة نفسها وليس to_numpy حتى يبقى نوع الكود (مثل UInt32) بعد الربط بأكواد غير موجودة
+    table.insert(0, 'code', codes.loc[keys.index].array)
+    table.insert(0, 'key', keys.to_numpy())
+    return table
+
+
+def verify_codes(codes, lookup_table):
+    """ربط جميع الأكواد المدخلة بجدول الأكواد في عملية ربط واحدة (hash join)
+
+    الكود المكرر في البيانات يظهر في أكثر من صف، والكود غير الموجود يظهر
+    مرة واحدة بدون بيانات.
+    """
+    queries = pd.DataFrame({'input': pd.Series(codes, dtype=object).astype(str).str.strip()})
+    queries['key'] = queries['input'].map(normalize_code)
+    result = queries.merge(lookup_table, on='key', how='left', sort=False)
+    result['found'] = result['code'].notna()
+    return result.drop(columns='key')
@@ -0,0 +1,198 @@
+"""بناء بطاقات نتائج البحث كجزء HTML واحد لكل منشأة"""
+import html
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_store import ARROW_STRING
+
+# كلمات تحديد حالة المنشأة في القائمة البيضاء
+good_status_words = ['مطابق', 'نعم', 'جيد', 'موافق']
+bad_status_words = ['رفض', 'مخالف']
+# أدوات النفي تُطابق ككلمات كاملة فقط ("لا" جزء من كلمات عادية مثل "للاشتراطات")
+negation_words = ['غير', 'لا']
+
+# تعبيرات RE2 التي تستخدمها نصوص Arrow (\pL تشمل الحروف العربية)
+_WORD_START = r'(?:^|[^\pL\pN])'
+_WORD_END = r'(?:$|[^\pL\pN])'
+_NEGATIONS = '(?:' + '|'.join(re.escape(word) for word in negation_words) + ')'
+_GOOD_STATUS = '|'.join(re.escape(word) for word in good_status_words)
+_BAD_STATUS = '|'.join(re.escape(word) for word in bad_status_words)
+# نفي كلمة موافقة مثل "غير مطابق" أو "لا موافق"
+_NEGATED_GOOD_STATUS = _WORD_START + _NEGATIONS + r'\s+(?:' + _GOOD_STATUS + ')'
+_NEGATION = _WORD_START + _NEGATIONS + _WORD_END
+
+# تصنيفات حالة المنشأة في القائمة البيضاء
+STATUS_CLASSES = ['good', 'bad', 'pending']
+
+# شارة القائمة البيضاء لكل حالة
+STATUS_BADGES = {
+    'good': "<span class='white-list-good'>مطابق</span>",
+    'bad': "<span class='white-list-bad'>غير مطابق</span>",
+    'pending': "<span class='white-list-pending'>قيد المراجعة</span>",
+}
+
+# أعمدة اسم المنشأة وأعمدة العنوان المفضلة بالترتيب
+NAME_COLUMNS = ['اسم المنشأة بالبطاقة الضريبية', 'اسم المنشأة على اللافتة']
+ADDRESS_COLUMNS = [
+    'عنوان المنشأة (المحافظة)',
+    'عنوان المنشأة (المنطقة / المدينة)',
+    'عنوان المنشأة (تفصيلياً)'
+]
+
+
+def _has_value(row, col):
+    """التحقق من وجود قيمة غير فارغة في العمود"""
+    return col in row and pd.notna(row[col]) and str(row[col]).strip() != ''
+
+
+def _text(value):
+    """تحويل القيمة إلى نص آمن للعرض داخل HTML"""
+    return html.escape(str(value))
+
+
+def _text_values(series):
+    """قيم العمود كنصوص Arrow مع استبدال القيم الفارغة بنص فارغ"""
+    return series.astype(ARROW_STRING).fillna('')
+
+
+def facility_names(data, name_columns):
+    """اسم المنشأة لجميع الصفوف: أول عمود اسم غير فارغ"""
+    names = pd.Series('', index=data.index, dtype=ARROW_STRING)
+    for col in dict.fromkeys(NAME_COLUMNS + list(name_columns)):
+        if col in data.columns:
+            values = _text_values(data[col])
+            names = names.mask((names == '') & (values.str.strip() != ''), values)
+    return names.mask(names == '', "منشأة غير معروفة")
+
+
+def status_classes(series):
+    """تصنيف قيم عمود الحالة إلى good أو bad أو pending لجميع الصفوف
+
+    نفي كلمة الموافقة ("غير مطابق") مرفوض، ثم أي كلمة موافقة مطابق، ثم كلمات
+    الرفض أو أداة نفي منفصلة مرفوض.
+    """
+    text = _text_values(series).str.lower()
+    classes = np.select(
+        [
+            text.str.contains(_NEGATED_GOOD_STATUS),
+            text.str.contains(_GOOD_STATUS),
+            text.str.contains(_BAD_STATUS) | text.str.contains(_NEGATION),
+        ],
+        ['bad', 'good', 'bad'],
+        'pending'
+    )
+    return pd.Series(pd.Categorical(classes, categories=STATUS_CLASSES), index=series.index)
+
+
+def full_addresses(data, address_columns):
+    """العنوان الكامل لجميع الصفوف من أعمدة المحافظة والمدينة والتفاصيل"""
+    columns = [col for col in ADDRESS_COLUMNS if col in data.columns] or list(address_columns)[:2]
+    address = pd.Series('', index=data.index, dtype=ARROW_STRING)
+    for col in columns:
+        part = _text_values(data[col]).str.strip()
+        separator = ((address != '') & (part != '')).map({True: '، ', False: ''})
+        address = address + separator.astype(ARROW_STRING) + part
+    return address
+
+
+def card_columns(data, schema):
+    """حساب اسم المنشأة وحالتها وعنوانها الكامل لجميع الصفوف مرة واحدة"""
+    if schema['statuses']:
+        status = status_classes(data[schema['statuses'][0]])
+    else:
+        status = pd.Series(pd.Categorical(['pending'] * len(data), categories=STATUS_CLASSES), index=data.index)
+    return pd.DataFrame({
+        'display_name': facility_names(data, schema['names']),
+        'status_class': status,
+        'full_address': full_addresses(data, schema['addresses']),
+    }, index=data.index)
+
+
+def render_facility_card(row, card, schema):
+    """بناء بطاقة المنشأة كاملة في جزء HTML واحد
+
+    الاسم والحالة والعنوان تُقرأ من الأعمدة المحسوبة مسبقاً (card) لنفس الصف.
+    """
+    code_value = row[schema.search_column] if schema.search_column in row else "غير محدد"
+
+    # العمود الأول: الفئة والأسماء
+    category = f"<b>{_text(row['فئة المنشأة'])}</b>" if _has_value(row, 'فئة المنشأة') else "غير محدد"
+    name_fields = []
+    if _has_value(row, 'اسم المنشأة بالبطاقة الضريبية'):
+        name_fields.append(f"الضريبي: {_text(row['اسم المنشأة بالبطاقة الضريبية'])}")
+    if _has_value(row, 'اسم المنشأة على اللافتة'):
+        name_fields.append(f"اللافتة: {_text(row['اسم المنشأة على اللافتة'])}")
+    names_html = "".join(f"<div>• {field}</div>" for field in name_fields) or "<div>غير متوفر</div>"
+
+    # العمود الثاني: العنوان
+    address_html = f"<div>{_text(card['full_address'])}</div>" if card['full_address'] else "<div>غير متوفر</div>"
+
+    # العمود الثالث: الحالة
+    if schema['statuses']:
+        status_html = f"<b>الحالة:</b> {STATUS_BADGES[card['status_class']]}"
+    else:
+        status_html = "<b>الحالة:</b> غير محددة"
+
+    # جميع بيانات المنشأة داخل قسم قابل للتوسيع
+    details_html = "".join(
+        f"<div><b>{_text(col)}:</b> {_text(row[col])}</div>"
+        for col in schema.columns if _has_value(row, col)
+    )
+
+    # بدون أسطر فارغة حتى يبقى الجزء كتلة HTML واحدة عند عرضه
+    return (
+        '<div class="facility-card">'
+        f'<h3>🏢 {_text(card["display_name"])}</h3>'
+        f'<p><b>الكود:</b> {_text(code_value)}</p>'
+        '<div class="card-grid">'
+        f'<div><b>فئة المنشأة:</b><div>{category}</div><b>أسماء المنشأة:</b>{names_html}</div>'
+        f'<div><b>العنوان:</b>{address_html}</div>'
+        f'<div><b>الحالة والإضافات:</b><div>{status_html}</div><div><b>حالة السجل:</b> نشط</div></div>'
+        '</div>'
+        f'<details><summary>📋 عرض جميع بيانات المنشأة</summary>{details_html}</details>'
+        '</div>'
+    )
+
+
+class CardCache:
+    """ذاكرة مؤقتة محدودة الحجم للبطاقات الجاهزة لنسخة واحدة من البيانات
+
+    المفاتيح على شكل (مفتاح تصنيف الأعمدة، معرّف الصف) وتُحذف الذاكرة كاملة مع نسختها.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cards)
+
+    def get_or_render(self, key, render):
+        """إرجاع البطاقة المحفوظة أو بناؤها وحفظها إذا لم تكن موجودة"""
+        with self._lock:
+            card = self._cards.get(key)
+            if card is not None:
+                self._cards.move_to_end(key)
+                return card
+        card = render()
+        with self._lock:
+            self._cards[key] = card
+            self._cards.move_to_end(key)
+            while len(self._cards) > self.max_entries:
+                self._cards.popitem(last=False)
+        return card
+
+    def without_rows(self, row_labels):
+        """نسخة للنسخة التالية من البيانات بدون بطاقات الصفوف المتغيرة"""
+        row_labels = set(row_labels)
+        cache = CardCache(self.max_entries)
+        with self._lock:
+            cache._cards = OrderedDict(
+                (key, card) for key, card in self._cards.items() if key[-1] not in row_labels
+            )
+        return cache
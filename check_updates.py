@@ -0,0 +1,145 @@
+"""التحقق من أن تحديث الفهارس للصفوف المتغيرة فقط يطابق بناءها من جديد
+
+يشتق من جدول البيانات ثلاث نسخ تالية: حذف صفوف فقط، وتعديل صفوف فقط، وإضافة
+صفوف فقط. لكل نسخة يمرر الجدول على diff_rows و Dataset.derive كما يفعل خيط
+التحديث، ثم يقارن نتائج كل فهرس محدث مع نفس الفهرس مبنياً من جديد على نفس
+الجدول. يخرج برمز 1 إذا اختلفت أي نتيجة.
+
+مثال:
+    FOOD_SAFETY_SHEET_URL=data.csv python check_updates.py
+"""
+import argparse
+import random
+import sys
+
+from aggregates import AggregationCube
+from data_store import DATA_SOURCES, KEY_COLUMN, Dataset, compact_dtypes, diff_rows, fetch_sheet
+from schema import resolve_schema
+from search_index import (
+    BM25Index, CodeIndex, FacetIndex, FuzzyIndex, PrefixIndex, TrigramIndex, normalize_code
+)
+
+
+def index_builders(schema):
+    """دالة بناء كل فهرس من الجدول مع أعمدته (نفس الفهارس التي يحدثها التطبيق)"""
+    code = (schema.search_column,)
+    names = tuple(schema['names']) or code
+    facets = tuple(schema['addresses'] + schema['types'])
+    values = lambda data, columns: [value for col in columns for value in data[col].tolist()]
+    return {
+        'code_index': (code, lambda data: CodeIndex(data[code[0]].tolist(), data.index)),
+        'text_index': (names, lambda data: TrigramIndex([data[col].tolist() for col in names], data.index)),
+        'ranked_index': (names, lambda data: BM25Index([data[col].tolist() for col in names], data.index)),
+        'fuzzy_codes': (code, lambda data: FuzzyIndex(values(data, code), normalize=normalize_code)),
+        'fuzzy_names': (names, lambda data: FuzzyIndex(values(data, names))),
+        'prefix_codes': (code, lambda data: PrefixIndex(values(data, code), normalize=normalize_code)),
+        'prefix_names': (names, lambda data: PrefixIndex(values(data, names), word_starts=True)),
+        'facet_index': (facets, lambda data: FacetIndex([data[col].tolist() for col in facets], data.index)),
+        'cube': (facets, lambda data: AggregationCube([data[col].tolist() for col in facets])),
+    }
+
+
+def register(dataset, builders):
+    """بناء جميع الفهارس لنسخة البيانات مع دالة تحديثها للصفوف المتغيرة"""
+    for key, (columns, build) in builders.items():
+        dataset.artifact(
+            key, lambda: build(dataset.data),
+            update=lambda index, changes, columns=columns: index.updated(*changes.columns(columns))
+        )
+
+
+def probe_results(dataset, schema, labels):
+    """نتائج كل فهرس لاستعلامات مأخوذة من الصفوف المحددة"""
+    data = dataset.data
+    code = schema.search_column
+    names = list(schema['names']) or [code]
+    results = {}
+    for label in labels:
+        code_value = str(data.at[label, code])
+        name = str(data.at[label, names[0]])
+        results[('code', label)] = dataset.cached_artifact('code_index').lookup(code_value)
+        results[('text', label)] = sorted(dataset.cached_artifact('text_index').search(name[:4]))
+        results[('ranked', label)] = dataset.cached_artifact('ranked_index').search(name.split()[0] if name.split() else name)
+        results[('fuzzy', label)] = (
+            dataset.cached_artifact('fuzzy_codes').suggest(code_value[:-1]),
+            dataset.cached_artifact('fuzzy_names').suggest(name[:2] + name[3:]),
+        )
+        # عند تساوي عدد الصفوف قد يختلف ترتيب القيم، فالمقارنة بالأعداد فقط
+        results[('prefix', label)] = (
+            [count for _, count in dataset.cached_artifact('prefix_codes').complete(code_value[:3])],
+            [count for _, count in dataset.cached_artifact('prefix_names').complete(name[:3])],
+        )
+    facets = dataset.cached_artifact('facet_index')
+    results['facets'] = [facets.counts(position, facets.all_rows) for position in range(len(facets.bitmaps))]
+    results['cube'] = dict(dataset.cached_artifact('cube').counts)
+    return results
+
+
+def scenarios(data, schema, changed_rows):
+    """النسخ التالية للجدول: حذف صفوف فقط، وتعديل صفوف فقط، وإضافة صفوف فقط"""
+    positions = sorted(random.sample(range(len(data)), min(changed_rows, len(data) // 2)))
+    keep = sorted(set(range(len(data))) - set(positions))
+    name = (list(schema['names']) or [schema.search_column])[0]
+    modified = data.copy()
+    modified[name] = modified[name].astype(object)
+    modified.loc[modified.index[positions], name] = [
+        f"{value} معدل" for value in modified[name].iloc[positions].tolist()
+    ]
+    # نفس ضغط الأنواع الذي يمر به الجدول الجديد عند قراءته
+    modified = compact_dtypes(modified)
+    return {
+        # الجدول الجديد يصل دائماً بمعرّفات 0، 1، 2، ... كما يقرأه خيط التحديث
+        'delete-only': (data, data.iloc[keep].reset_index(drop=True)),
+        'modify-only': (data, modified.reset_index(drop=True)),
+        'add-only': (data.iloc[keep].reset_index(drop=True), data.reset_index(drop=True)),
+    }
+
+
+def check(old_data, new_data, schema, key_column):
+    """قائمة الاختلافات بين النسخة المشتقة والنسخة المبنية من جديد"""
+    builders = index_builders(schema)
+    previous = Dataset(old_data)
+    register(previous, builders)
+    data, changes = diff_rows(previous.data, new_data, key_column)
+    derived = previous.derive(data, changes)
+    fresh = Dataset(data)
+    register(fresh, builders)
+
+    problems = []
+    if not data.reset_index(drop=True).equals(new_data):
+        problems.append("table content differs from the new export")
+    if not set(data.index) - set(changes.added) <= set(old_data.index):
+        problems.append("unchanged rows did not keep their labels")
+    labels = list(changes.added) + random.sample(list(data.index), min(20, len(data)))
+    derived_results = probe_results(derived, schema, labels)
+    fresh_results = probe_results(fresh, schema, labels)
+    for key, value in fresh_results.items():
+        if derived_results[key] != value:
+            problems.append(f"{key}: derived {derived_results[key]!r} != fresh {value!r}")
+    return changes, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=DATA_SOURCES, help="رابط أو مسار ملف البيانات (افتراضياً مصادر FOOD_SAFETY_SOURCES)")
+    parser.add_argument('--changed-rows', type=int, default=50, help="عدد الصفوف المحذوفة أو المعدلة أو المضافة")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    data = fetch_sheet(args.source).reset_index(drop=True)
+    schema = resolve_schema(data)
+    key_column = KEY_COLUMN if KEY_COLUMN in data.columns else schema.search_column
+    failed = False
+    for name, (old_data, new_data) in scenarios(data, schema, args.changed_rows).items():
+        changes, problems = check(old_data, new_data, schema, key_column)
+        status = "ok" if not problems else f"FAILED ({len(problems)})"
+        print(f"{name:<12} removed {len(changes.removed):>5}  added {len(changes.added):>5}  {status}")
+        for problem in problems[:10]:
+            print(f"    {problem}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
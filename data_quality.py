@@ -0,0 +1,106 @@
+"""فحص جودة البيانات مرة واحدة لكل نسخة: الامتلاء والتكرار والأكواد والقيم غير المتوقعة"""
+import pandas as pd
+
+from arabic_text import normalize_arabic
+from data_store import ARROW_STRING
+
+# القيمة النادرة في عمود فئات: تظهر في عدد صفوف لا يتجاوز هذه النسبة (صف واحد على الأقل)
+RARE_VALUE_RATIO = 0.001
+
+# تحويل الكود إلى شكله العام: كل سلسلة أرقام تصبح 9 وكل سلسلة حروف تصبح A
+# (تعبيرات RE2 التي تستخدمها نصوص Arrow، وتشمل الحروف والأرقام العربية)
+_DIGIT_RUNS = r'\pN+'
+_LETTER_RUNS = r'\pL+'
+
+
+def code_shapes(codes):
+    """الشكل العام لكل كود (مثلاً FS100123 يصبح A9)"""
+    text = codes.astype(ARROW_STRING).str.strip()
+    return text.str.replace(_DIGIT_RUNS, '9', regex=True).str.replace(_LETTER_RUNS, 'A', regex=True)
+
+
+class QualityReport:
+    """نتيجة فحص جودة نسخة واحدة من البيانات"""
+
+    def __init__(self, columns, duplicate_codes, malformed_codes, expected_code_shape, unexpected_values):
+        self.columns = columns
+        self.duplicate_codes = duplicate_codes
+        self.malformed_codes = malformed_codes
+        self.expected_code_shape = expected_code_shape
+        self.unexpected_values = unexpected_values
+
+    @property
+    def issue_count(self):
+        """عدد المشكلات المكتشفة (أكواد مكررة ومخالفة وقيم غير متوقعة)"""
+        return len(self.duplicate_codes) + len(self.malformed_codes) + len(self.unexpected_values)
+
+
+def _column_profile(data):
+    """نسبة القيم الفارغة والنصوص الفارغة وعدد القيم المختلفة لكل عمود"""
+    rows = len(data)
+    profile = []
+    for col in data.columns:
+        series = data[col]
+        filled = int(series.count())
+        blank = 0
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(series.dtype):
+            blank = int((series.astype(ARROW_STRING).str.strip() == '').sum())
+        profile.append({
+            'العمود': col,
+            'النوع': str(series.dtype),
+            'مملوء': filled,
+            'فارغ %': round((rows - filled) / rows * 100, 1) if rows else 0.0,
+            'نص فارغ %': round(blank / rows * 100, 1) if rows else 0.0,
+            'قيم مختلفة': int(series.nunique()),
+        })
+    return pd.DataFrame(profile)
+
+
+def _unexpected_values(data, columns, rare_ratio):
+    """القيم النادرة والكتابات المختلفة لنفس القيمة في أعمدة الفئات"""
+    issues = []
+    for col in columns:
+        counts = data[col].value_counts()
+        counts = counts[counts > 0]
+        if counts.empty:
+            continue
+        # نفس القيمة بكتابات مختلفة (مثل القاهرة / القاهره) بعد توحيد الحروف العربية
+        normalized = pd.Series([normalize_arabic(str(value)) for value in counts.index], index=counts.index)
+        variants = normalized[normalized.duplicated(keep=False)]
+        for value in variants.index:
+            issues.append({'العمود': col, 'القيمة': value, 'العدد': int(counts[value]), 'السبب': 'كتابة مختلفة لنفس القيمة'})
+        # قيم نادرة مقارنة بحجم البيانات
+        limit = max(1, int(rare_ratio * len(data)))
+        for value in counts[(counts <= limit) & ~counts.index.isin(variants.index)].index:
+            issues.append({'العمود': col, 'القيمة': value, 'العدد': int(counts[value]), 'السبب': 'قيمة نادرة'})
+    return pd.DataFrame(issues, columns=['العمود', 'القيمة', 'العدد', 'السبب'])
+
+
+def profile_dataset(data, code_column, category_columns=(), rare_ratio=RARE_VALUE_RATIO):
+    """فحص جودة البيانات بعمليات على الأعمدة كاملة دون المرور على الصفوف"""
+    columns = _column_profile(data)
+
+    duplicate_codes = pd.DataFrame(columns=['الكود', 'عدد التكرار'])
+    malformed_codes = pd.DataFrame(columns=['الصف', 'الكود', 'الشكل'])
+    expected_shape = None
+    if code_column in data.columns:
+        codes = data[code_column]
+        counts = codes.value_counts()
+        duplicates = counts[counts > 1]
+        duplicate_codes = pd.DataFrame({'الكود': duplicates.index, 'عدد التكرار': duplicates.to_numpy()})
+
+        # الشكل الأكثر تكراراً هو الشكل المتوقع، والفارغ أو المختلف عنه كود مخالف
+        shapes = code_shapes(codes).fillna('')
+        filled_shapes = shapes[shapes != '']
+        if len(filled_shapes):
+            expected_shape = filled_shapes.value_counts().index[0]
+        malformed = shapes != expected_shape
+        malformed_codes = pd.DataFrame({
+            'الصف': data.index[malformed.to_numpy()],
+            'الكود': codes[malformed].to_numpy(),
+            'الشكل': shapes[malformed].to_numpy(),
+        })
+
+    category_columns = [col for col in category_columns if col in data.columns]
+    unexpected = _unexpected_values(data, category_columns, rare_ratio)
+    return QualityReport(columns, duplicate_codes, malformed_codes, expected_shape, unexpected)
@@ -0,0 +1,654 @@
+"""تحميل بيانات المنشآت وحفظ نسخ محلية منها للتشغيل السريع وبدون اتصال"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from schema import align_columns, is_text_column
+from search_index import normalize_code
+
+logger = logging.getLogger(__name__)
+
+# رابط ملف البيانات (يمكن استبداله بملف محلي أو خادم محلي أثناء الاختبار)
+DEFAULT_SHEET_URL = "https://docs.google.com/spreadsheets/d/1EN0muIIOrV5tqRoY02SX2Q5DdRFEM_CGo1Es4xueCgA/export?format=csv"
+SHEET_URL = os.environ.get("FOOD_SAFETY_SHEET_URL", DEFAULT_SHEET_URL)
+
+# اسم عمود المصدر في البيانات المدمجة من عدة ملفات
+SOURCE_COLUMN = 'المصدر'
+# أقصى عدد مصادر تُحمّل في نفس الوقت
+MAX_FETCH_WORKERS = 8
+# عدد الصفوف في كل دفعة عند قراءة ملف البيانات
+CHUNK_ROWS = 20000
+
+# مجلد النسخ المحلية من البيانات
+SNAPSHOT_DIR = os.environ.get(
+    "FOOD_SAFETY_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+)
+
+# عمود المفتاح المستخدم لمقارنة الصفوف بين نسختين
+KEY_COLUMN = 'الكود المنشأة'
+
+# أقصى نسبة للقيم المختلفة إلى القيم المملوءة لتحويل العمود النصي إلى فئات
+CATEGORY_RATIO = 0.2
+
+# نصوص مخزنة بصيغة Arrow (القيم الفارغة NaN كما في أعمدة pandas المعتادة)
+try:
+    ARROW_STRING = pd.StringDtype('pyarrow', na_value=np.nan)
+except TypeError:
+    # إصدارات pandas 2.1 و 2.2
+    ARROW_STRING = 'string[pyarrow_numpy]'
+
+_DIGITS_CODE = re.compile(r'0|[1-9]\d{0,18}')
+
+_SNAPSHOT_NAME = re.compile(r'^snapshot_(\d{8}T\d{6}\d{6})_([0-9a-f]+)\.parquet$')
+
+
+def dataset_version(data):
+    """حساب رقم نسخة البيانات من محتواها"""
+    return format(int(pd.util.hash_pandas_object(data, index=False).sum()), 'x')
+
+
+def fetch_payload(source=SHEET_URL, validators=None, timeout=60):
+    """تحميل محتوى ملف البيانات مع طلب مشروط إن أمكن
+
+    يرجع (المحتوى، بيانات التحقق)، والمحتوى None إذا لم يتغير الملف منذ آخر تحميل.
+    """
+    validators = validators or {}
+    if source.startswith(('http://', 'https://')):
+        request = urllib.request.Request(source)
+        if validators.get('etag'):
+            request.add_header('If-None-Match', validators['etag'])
+        if validators.get('last_modified'):
+            request.add_header('If-Modified-Since', validators['last_modified'])
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                payload = response.read()
+                new_validators = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, validators
+            raise
+        return payload, new_validators
+
+    # ملف محلي: وقت التعديل والحجم يكفيان لمعرفة عدم التغيير
+    stat = os.stat(source)
+    file_validator = (stat.st_mtime_ns, stat.st_size)
+    if validators.get('file') == file_validator:
+        return None, validators
+    with open(source, 'rb') as f:
+        return f.read(), {'file': file_validator}
+
+
+def _compact_codes(series):
+    """تخزين الأكواد الموحدة كأعداد صحيحة إذا كانت كلها أرقاماً، وإلا كنصوص Arrow"""
+    codes = series.map(normalize_code, na_action='ignore')
+    filled = codes.dropna()
+    if len(filled) and filled.map(lambda code: bool(_DIGITS_CODE.fullmatch(code))).all():
+        # حتى 19 رقماً بدون أصفار بادئة: تتسع دائماً في UInt64
+        numbers = codes.map(int, na_action='ignore')
+        return numbers.astype('UInt32' if numbers.max() < 2 ** 32 else 'UInt64')
+    if is_text_column(series):
+        return series.astype(ARROW_STRING)
+    return series
+
+
+def compact_dtypes(data, key_column=KEY_COLUMN, category_ratio=CATEGORY_RATIO):
+    """تحويل الأعمدة إلى أنواع أصغر في الذاكرة عند تحميل البيانات
+
+    الأعمدة النصية قليلة القيم المختلفة (المحافظة، المدينة، فئة المنشأة) تصبح
+    فئات، وباقي النصوص تُخزن بصيغة Arrow، وعمود الكود يُخزن بشكله الموحد.
+    """
+    data = data.copy(deep=False)
+    for col in data.columns:
+        series = data[col]
+        if col == key_column:
+            data[col] = _compact_codes(series)
+        elif is_text_column(series):
+            filled = series.count()
+            if filled and series.nunique() <= category_ratio * filled:
+                data[col] = series.astype('category')
+            else:
+                data[col] = series.astype(ARROW_STRING)
+    return data
+
+
+def _loaded_memory(series):
+    """حجم العمود كما كان يُحمّل قبل ضغط الأنواع (نصوص Python وأكواد عشرية)"""
+    if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(series.dtype):
+        return series.astype(object).memory_usage(deep=True, index=False)
+    if pd.api.types.is_extension_array_dtype(series.dtype) and pd.api.types.is_integer_dtype(series.dtype):
+        return len(series) * np.dtype('float64').itemsize
+    return series.memory_usage(deep=True, index=False)
+
+
+def memory_report(data):
+    """حجم كل عمود في الذاكرة قبل ضغط الأنواع وبعده بالميجابايت"""
+    return pd.DataFrame([
+        {
+            'العمود': col,
+            'النوع': str(data[col].dtype),
+            'قبل (ميجابايت)': _loaded_memory(data[col]) / 2 ** 20,
+            'بعد (ميجابايت)': data[col].memory_usage(deep=True, index=False) / 2 ** 20,
+        }
+        for col in data.columns
+    ])
+
+
+def parse_sources(text):
+    """قائمة المصادر [(الاسم، الرابط أو المسار)] من نص الإعدادات
+
+    مصدر في كل سطر أو مفصولة بـ ; واسم المصدر اختياري قبل |، مثلاً:
+        القاهرة|https://.../export?format=csv;الجيزة|/data/giza.csv
+    """
+    sources = []
+    for entry in re.split(r'[;\n]+', text or ''):
+        name, _, location = entry.strip().rpartition('|')
+        location = location.strip()
+        if location:
+            sources.append((name.strip() or f"مصدر {len(sources) + 1}", location))
+    return sources
+
+
+# مصادر البيانات (ملف لكل مديرية)، وبدون FOOD_SAFETY_SOURCES يُستخدم الملف الواحد SHEET_URL
+DATA_SOURCES = parse_sources(os.environ.get("FOOD_SAFETY_SOURCES")) or [(None, SHEET_URL)]
+
+
+def as_sources(source):
+    """توحيد المصدر: رابط أو مسار واحد يصبح قائمة بمصدر واحد بدون اسم"""
+    if isinstance(source, str):
+        return [(None, source)]
+    return list(source)
+
+
+def _compact_chunk(chunk):
+    """ضغط دفعة واحدة فور قراءتها: النصوص بصيغة Arrow (الفئات والأكواد تُحدد للجدول كاملاً)"""
+    for col in chunk.columns:
+        if is_text_column(chunk[col]):
+            chunk[col] = chunk[col].astype(ARROW_STRING)
+    return chunk
+
+
+def read_sheet(payload, on_chunk=None, chunk_rows=CHUNK_ROWS):
+    """تحويل محتوى ملف CSV إلى جدول على دفعات مع تنظيف أسماء الأعمدة وضغط كل دفعة
+
+    لا يوجد الجدول كاملاً بنصوص Python في الذاكرة في أي وقت، فتبقى الذاكرة
+    أثناء القراءة قريبة من حجم الجدول النهائي. الدالة on_chunk (اختيارية)
+    تُستدعى لكل دفعة مع عدد البايتات المقروءة من الملف حتى الآن.
+    """
+    stream = io.BytesIO(payload)
+    chunks = []
+    with pd.read_csv(stream, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            chunk = _compact_chunk(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk, stream.tell())
+            chunks.append(chunk)
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _prepared(data):
+    """ضغط أنواع الأعمدة وحساب رقم النسخة للجدول النهائي"""
+    data = compact_dtypes(data)
+    data.attrs['dataset_version'] = dataset_version(data)
+    return data
+
+
+def parse_sheet(payload):
+    """تحويل محتوى ملف CSV إلى جدول وتنظيف أسماء الأعمدة وضغط أنواعها"""
+    return _prepared(read_sheet(payload))
+
+
+def _parallel(function, items, max_workers=MAX_FETCH_WORKERS):
+    """تطبيق الدالة على جميع العناصر بالتوازي مع الحفاظ على ترتيبها"""
+    if len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(function, items))
+
+
+def fetch_sources(sources, validators=None):
+    """تحميل جميع المصادر بالتوازي مع طلب مشروط لكل مصدر
+
+    يرجع (المحتوى، بيانات التحقق) لكل مصدر بنفس الترتيب، والمحتوى None للمصدر
+    الذي لم يتغير. الزمن الكلي قريب من زمن أبطأ مصدر وليس مجموع الأزمنة.
+    """
+    validators = validators or {}
+    return _parallel(lambda source: fetch_payload(source[1], validators.get(source[1])), sources)
+
+
+def merge_sources(payloads, names, on_chunk=None):
+    """قراءة ملفات المصادر بالتوازي ودمجها في جدول واحد بأعمدة موحدة
+
+    كل صف يحمل اسم مصدره في عمود المصدر. المصدر الواحد بدون اسم يُقرأ كما هو.
+    الدالة on_chunk (اختيارية) تُستدعى بـ (رقم المصدر، الدفعة، البايتات المقروءة).
+    """
+    def read(position):
+        report = None
+        if on_chunk is not None:
+            report = lambda chunk, read_bytes: on_chunk(position, chunk, read_bytes)
+        return read_sheet(payloads[position], report)
+
+    frames = _parallel(read, list(range(len(payloads))))
+    if len(frames) == 1 and names[0] is None:
+        return _prepared(frames[0])
+    frames = align_columns(frames)
+    data = pd.concat(
+        [frame.assign(**{SOURCE_COLUMN: name}) for frame, name in zip(frames, names)],
+        ignore_index=True
+    )
+    return _prepared(data)
+
+
+def fetch_sheet(source=SHEET_URL):
+    """قراءة ملف البيانات (أو قائمة مصادر) من الروابط أو المسارات المحددة"""
+    sources = as_sources(source)
+    payloads = [payload for payload, _ in fetch_sources(sources)]
+    return merge_sources(payloads, [name for name, _ in sources])
+
+
+class RowChanges:
+    """الصفوف المحذوفة والمضافة بين نسختين من البيانات (الصف المعدل يظهر في الاثنين)"""
+
+    def __init__(self, old_data, new_data, removed, added):
+        self.old_data = old_data
+        self.new_data = new_data
+        self.removed = removed
+        self.added = added
+
+    def __len__(self):
+        return len(self.removed) + len(self.added)
+
+    def columns(self, columns):
+        """قيم الأعمدة المطلوبة للصفوف المحذوفة والمضافة بالترتيب الذي تتوقعه الفهارس"""
+        removed_rows = self.old_data.loc[self.removed]
+        added_rows = self.new_data.loc[self.added]
+        return (
+            self.removed, [removed_rows[col].tolist() for col in columns],
+            self.added, [added_rows[col].tolist() for col in columns]
+        )
+
+
+def _row_keys(data, key_column, labels):
+    """جدول مساعد لمقارنة الصفوف: الكود وبصمة محتوى الصف وترتيب تكراره"""
+    keys = pd.DataFrame({
+        'code': data[key_column].astype(str).to_numpy(),
+        'hash': pd.util.hash_pandas_object(data, index=False).to_numpy(),
+        'label': labels
+    })
+    keys['occurrence'] = keys.groupby(['code', 'hash']).cumcount()
+    return keys
+
+
+def diff_rows(old_data, new_data, key_column=KEY_COLUMN):
+    """مقارنة نسختين حسب عمود الكود وإعطاء الصفوف غير المتغيرة نفس معرّفاتها القديمة
+
+    يرجع الجدول الجديد بمعرّفات ثابتة مع كائن RowChanges بالصفوف المتغيرة فقط.
+    """
+    old_keys = _row_keys(old_data, key_column, old_data.index.to_numpy())
+    new_keys = _row_keys(new_data, key_column, np.full(len(new_data), -1, dtype='int64'))
+
+    # الصفوف المطابقة تماماً (نفس الكود ونفس المحتوى) تحتفظ بمعرّفاتها
+    matched = new_keys[['code', 'hash', 'occurrence']].merge(
+        old_keys[['code', 'hash', 'occurrence', 'label']], how='left', on=['code', 'hash', 'occurrence']
+    )
+    # نسخة قابلة للكتابة (to_numpy قد يرجع مصفوفة للقراءة فقط مع النسخ عند الكتابة)
+    labels = np.array(matched['label'].fillna(-1), dtype='int64')
+    unchanged = labels >= 0
+    unused_old = old_keys[~old_keys['label'].isin(labels[unchanged])]
+
+    # الصفوف المعدلة: نفس الكود بمحتوى مختلف تأخذ معرّف الصف القديم
+    pending = new_keys[~unchanged].copy()
+    pending['position'] = np.flatnonzero(~unchanged)
+    pending['occurrence'] = pending.groupby('code').cumcount()
+    unused_old = unused_old.assign(occurrence=unused_old.groupby('code').cumcount())
+    modified = pending.merge(unused_old[['code', 'occurrence', 'label']], how='left', on=['code', 'occurrence'],
+                             suffixes=('_new', ''))
+    modified_labels = modified['label'].fillna(-1).to_numpy(dtype='int64')
+    labels[pending['position'].to_numpy()] = modified_labels
+
+    # الصفوف الجديدة تماماً تأخذ معرّفات جديدة
+    new_rows = labels < 0
+    next_label = int(old_data.index.max()) + 1 if len(old_data) else 0
+    labels[new_rows] = np.arange(next_label, next_label + int(new_rows.sum()))
+
+    # الصفوف القديمة غير المطابقة إما محذوفة أو معدلة، وفي الحالتين تُحذف قيمها القديمة من الفهارس
+    removed = unused_old['label'].tolist()
+    added = labels[~unchanged].tolist()
+
+    new_data = new_data.set_axis(pd.Index(labels), axis=0)
+    return new_data, RowChanges(old_data, new_data, removed, added)
+
+
+class SnapshotStore:
+    """حفظ نسخ البيانات بصيغة Parquet واسترجاع أحدثها"""
+
+    def __init__(self, directory=SNAPSHOT_DIR, keep=5):
+        self.directory = directory
+        self.keep = keep
+
+    def _snapshots(self):
+        """قائمة ملفات النسخ المحفوظة مرتبة من الأقدم إلى الأحدث"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if _SNAPSHOT_NAME.match(name))
+
+    def save(self, data):
+        """حفظ نسخة جديدة من البيانات وحذف النسخ القديمة الزائدة"""
+        os.makedirs(self.directory, exist_ok=True)
+        version = data.attrs.get('dataset_version') or dataset_version(data)
+        name = f"snapshot_{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{version}.parquet"
+        path = os.path.join(self.directory, name)
+        # الكتابة في ملف مؤقت ثم إعادة التسمية حتى لا تُقرأ نسخة غير مكتملة
+        temp_path = path + ".tmp"
+        data.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+
+        for old_name in self._snapshots()[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except OSError:
+                pass
+        return path
+
+    def latest(self):
+        """قراءة أحدث نسخة محفوظة مع تاريخ حفظها أو None إذا لم توجد نسخ"""
+        for name in reversed(self._snapshots()):
+            match = _SNAPSHOT_NAME.match(name)
+            try:
+                data = pd.read_parquet(os.path.join(self.directory, name))
+                # النسخ الأقدم قد تكون محفوظة قبل ضغط الأنواع
+                data = compact_dtypes(data)
+            except Exception as e:
+                logger.warning("تعذرت قراءة النسخة المحفوظة %s: %s", name, e)
+                continue
+            data.attrs['dataset_version'] = match.group(2)
+            saved_at = datetime.strptime(match.group(1), '%Y%m%dT%H%M%S%f')
+            return data, saved_at
+        return None
+
+
+class Dataset:
+    """نسخة ثابتة من البيانات مع الفهارس والنتائج المشتقة منها
+
+    كائن واحد لكل عملية تتشاركه جميع الجلسات بالمرجع دون نسخ، لذلك لا يجوز
+    تعديل الجدول data؛ الجلسة التي تحتاج جدولاً قابلاً للتعديل تستخدم view().
+    """
+
+    def __init__(self, data, loaded_at=None, from_snapshot=False):
+        self._data = data
+        self.version = data.attrs.get('dataset_version') or dataset_version(data)
+        self.loaded_at = loaded_at or datetime.now()
+        self.from_snapshot = from_snapshot
+        self.content_hash = None
+        self._artifacts = {}
+        self._updaters = {}
+        self._artifact_locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def data(self):
+        """الجدول المشترك للقراءة فقط"""
+        return self._data
+
+    def view(self):
+        """نسخة سطحية للجلسة تشارك ذاكرة الأعمدة مع الجدول المشترك
+
+        مع النسخ عند الكتابة في pandas لا تُنسخ الأعمدة إلا إذا عدلتها الجلسة،
+        فيبقى الجدول المشترك كما هو.
+        """
+        return self._data.copy(deep=False)
+
+    @property
+    def age_seconds(self):
+        """عمر هذه النسخة بالثواني منذ تحميلها"""
+        return (datetime.now() - self.loaded_at).total_seconds()
+
+    def artifact(self, key, build, update=None):
+        """إرجاع ناتج مشتق من البيانات مع بنائه مرة واحدة فقط لهذه النسخة
+
+        الدالة update (اختيارية) تستقبل الناتج القديم وكائن RowChanges وترجع
+        ناتجاً محدثاً، وتُستخدم عند اشتقاق النسخة التالية بدلاً من إعادة البناء.
+        """
+        artifact = self._artifacts.get(key)
+        if artifact is not None:
+            return artifact
+        with self._lock:
+            key_lock = self._artifact_locks.setdefault(key, threading.Lock())
+        # قفل لكل ناتج حتى ينتظر الطلبات المتزامنة بناءً واحداً فقط
+        with key_lock:
+            artifact = self._artifacts.get(key)
+            if artifact is None:
+                artifact = build()
+                self._artifacts[key] = artifact
+                if update is not None:
+                    with self._lock:
+                        self._updaters[key] = update
+        return artifact
+
+    def cached_artifact(self, key):
+        """إرجاع الناتج إذا سبق بناؤه لهذه النسخة، أو None دون بنائه"""
+        return self._artifacts.get(key)
+
+    def derive(self, data, changes):
+        """إنشاء النسخة التالية مع تحديث الفهارس للصفوف المتغيرة فقط"""
+        dataset = Dataset(data)
+        # نسخة من دوال التحديث لأن الجلسات قد تضيف نواتج جديدة أثناء الاشتقاق
+        with self._lock:
+            updaters = list(self._updaters.items())
+        for key, update in updaters:
+            dataset._artifacts[key] = update(self._artifacts[key], changes)
+            dataset._updaters[key] = update
+        return dataset
+
+
+class DatasetRefresher:
+    """خيط خلفي واحد لكل عملية يعيد تحميل البيانات دورياً ويبدل النسخة الحالية دفعة واحدة"""
+
+    def __init__(self, source=DATA_SOURCES, store=None, interval=300, warmup=None, key_column=KEY_COLUMN,
+                 chunk_indexer=None):
+        self.sources = as_sources(source)
+        self.key_column = key_column
+        self.store = store or SnapshotStore()
+        self.interval = interval
+        self.warmup = warmup
+        # دالة ترجع (إضافة دفعة للفهارس، تسجيل الفهارس في النسخة) لبناء الفهارس أثناء القراءة
+        self.chunk_indexer = chunk_indexer
+        # تقدم التحميل الجاري على شكل (النسبة من 0 إلى 1، الوصف) لعرضه في الواجهة
+        self.progress = (0.0, "")
+        self.last_error = None
+        self.last_checked_at = None
+        # عدد الصفوف المتغيرة في آخر تحديث (بدون الاحتفاظ بجدولي النسختين)
+        self.last_changed_rows = None
+        self._validators = {}
+        # آخر محتوى لكل مصدر لإعادة الدمج عند تغير بعض المصادر فقط
+        self._payloads = {}
+        self._current = None
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._flight = None
+        self._flight_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """تحميل آخر نسخة محلية فوراً ثم بدء خيط التحديث في الخلفية"""
+        snapshot = self.store.latest()
+        if snapshot is not None:
+            data, saved_at = snapshot
+            self._swap(Dataset(data, loaded_at=saved_at, from_snapshot=True))
+        self._thread = threading.Thread(target=self._run, name="dataset-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def loading(self):
+        """هل ما زال التحميل الأول جارياً (لا توجد نسخة ولا خطأ بعد)"""
+        return not self._ready.is_set()
+
+    def current(self, timeout=120):
+        """إرجاع النسخة الحالية، مع الانتظار فقط إذا لم تتوفر أي نسخة بعد"""
+        if self._current is None:
+            self._ready.wait(timeout)
+        return self._current
+
+    def refresh(self, timeout=120):
+        """طلب تحديث فوري وانتظار اكتماله
+
+        جميع الطلبات المتزامنة تنضم إلى نفس عملية التحميل الجارية بدلاً من
+        أن يبدأ كل طلب تحميلاً مستقلاً.
+        """
+        with self._flight_lock:
+            flight = self._flight
+            if flight is None:
+                flight = self._flight = threading.Event()
+                self._wake.set()
+        flight.wait(timeout)
+        return self._current
+
+    def _swap(self, dataset):
+        """استبدال النسخة الحالية بعد اكتمال بنائها (عملية إسناد واحدة)"""
+        self._current = dataset
+        self._ready.set()
+
+    def _warm(self, dataset):
+        """بناء الفهارس المشتقة مسبقاً قبل إتاحة النسخة للمستخدمين"""
+        if self.warmup is None:
+            return
+        try:
+            self.warmup(dataset)
+        except Exception as e:
+            logger.warning("تعذر تجهيز فهارس البيانات: %s", e)
+
+    def _accept(self, validators, payloads):
+        """حفظ بيانات التحقق والمحتوى بعد نجاح التحديث فقط
+
+        إذا فشل التحليل أو البناء تبقى البيانات القديمة، فيُعاد تحميل الملفات
+        وتحليلها في المحاولة التالية بدلاً من اعتبارها بلا تغيير.
+        """
+        self._validators = validators
+        if len(self.sources) > 1:
+            self._payloads = {location: payload for (_, location), payload in zip(self.sources, payloads)}
+        self.last_error = None
+
+    def _read(self, payloads, add_chunk=None):
+        """قراءة المصادر على دفعات مع تحديث نسبة التقدم وإضافة كل دفعة للفهارس"""
+        total_bytes = max(1, sum(len(payload) for payload in payloads))
+        read_bytes = [0] * len(payloads)
+        rows = [0]
+
+        def on_chunk(position, chunk, position_bytes):
+            read_bytes[position] = position_bytes
+            rows[0] += len(chunk)
+            fraction = min(1.0, sum(read_bytes) / total_bytes)
+            self.progress = (0.1 + 0.7 * fraction, f"قراءة الصفوف ({rows[0]:,} صف)")
+            if add_chunk is not None:
+                add_chunk(chunk)
+
+        return merge_sources(payloads, [name for name, _ in self.sources], on_chunk)
+
+    def _refresh(self):
+        """تحميل البيانات من المصدر واستبدال النسخة الحالية إذا تغيرت"""
+        self.progress = (0.0, "تحميل ملفات البيانات")
+        results = fetch_sources(self.sources, self._validators)
+        self.last_checked_at = datetime.now()
+        current = self._current
+        if all(payload is None for payload, _ in results):
+            # لم يتغير أي ملف حسب بيانات التحقق (HTTP 304 أو نفس وقت التعديل)
+            self.last_error = None
+            return current
+        payloads = []
+        validators = dict(self._validators)
+        for (_, location), (payload, source_validators) in zip(self.sources, results):
+            if payload is None:
+                payload = self._payloads[location]
+            validators[location] = source_validators
+            payloads.append(payload)
+        digest = hashlib.sha256()
+        for payload in payloads:
+            digest.update(hashlib.sha256(payload).digest())
+        content_hash = digest.hexdigest()
+        if current is not None and current.content_hash == content_hash:
+            # نفس المحتوى بالضبط: لا حاجة لتحليل الملفات
+            self._accept(validators, payloads)
+            return current
+
+        add_chunk = seed = None
+        if self.chunk_indexer is not None and current is None and len(self.sources) == 1:
+            # أول تحميل بدون نسخة سابقة: الفهارس تُبنى دفعة دفعة أثناء القراءة
+            add_chunk, seed = self.chunk_indexer()
+        data = self._read(payloads, add_chunk)
+        self.progress = (0.8, "حفظ نسخة محلية من البيانات")
+        if current is not None and current.version == data.attrs['dataset_version']:
+            current.content_hash = content_hash
+            self._accept(validators, payloads)
+            return current
+        try:
+            self.store.save(data)
+        except Exception as e:
+            logger.warning("تعذر حفظ نسخة محلية من البيانات: %s", e)
+
+        if (current is not None and self.key_column in data.columns
+                and list(current.data.columns) == list(data.columns)):
+            # نفس الأعمدة: تحديث الفهارس للصفوف المتغيرة فقط
+            data, changes = diff_rows(current.data, data, self.key_column)
+            dataset = current.derive(data, changes)
+            self.last_changed_rows = len(set(changes.removed) | set(changes.added))
+        else:
+            dataset = Dataset(data)
+            if seed is not None:
+                seed(dataset)
+            self.last_changed_rows = None
+        dataset.content_hash = content_hash
+        self.progress = (0.9, "تجهيز الفهارس")
+        self._warm(dataset)
+        self._swap(dataset)
+        self._accept(validators, payloads)
+        return dataset
+
+    def _run(self):
+        """حلقة التحديث الدوري"""
+        current = self._current
+        if current is not None:
+            # تجهيز فهارس النسخة المحلية أولاً ثم التحديث عند انتهاء صلاحيتها
+            self._warm(current)
+            wait = max(0.0, self.interval - current.age_seconds)
+        else:
+            wait = 0.0
+        while True:
+            if wait:
+                self._wake.wait(wait)
+            self._wake.clear()
+            # التحديث الدوري أيضاً عملية يمكن للطلبات الجديدة الانضمام إليها
+            with self._flight_lock:
+                flight = self._flight
+                if flight is None:
+                    flight = self._flight = threading.Event()
+            try:
+                self._refresh()
+            except Exception as e:
+                self.last_error = e
+                logger.warning("تعذر تحديث البيانات في الخلفية: %s", e)
+                if self._current is None:
+                    # لا توجد أي نسخة: نسمح للمستخدمين بعرض رسالة الخطأ بدلاً من الانتظار
+                    self._ready.set()
+            finally:
+                self.progress = (1.0, "")
+                with self._flight_lock:
+                    self._flight = None
+                flight.set()
+            wait = self.interval
@@ -0,0 +1,133 @@
+"""اكتشاف المنشآت المسجلة أكثر من مرة بأكواد مختلفة
+
+بدلاً من مقارنة كل صفين (n²) تُقسم الصفوف إلى مجموعات صغيرة حسب المحافظة
+والمدينة وكل كلمة من كلمات الاسم الموحد، ولا تُقارن إلا الصفوف داخل نفس
+المجموعة. الكلمات الشائعة جداً (مثل "مطعم") تكوّن مجموعات كبيرة فتُتجاهل،
+ويكفي أن يشترك الصفان في كلمة مميزة واحدة ليُقارنا.
+
+يمكن تشغيله كمهمة مستقلة:
+    python duplicates.py --output duplicates.csv
+"""
+import argparse
+import time
+from difflib import SequenceMatcher
+from itertools import combinations
+
+import pandas as pd
+
+from arabic_text import tokenize
+from data_store import DATA_SOURCES, fetch_sheet
+from schema import resolve_schema
+from search_index import normalize_text
+
+# أقل درجة تشابه لاعتبار الصفين منشأة واحدة
+DUPLICATE_THRESHOLD = 0.85
+# أكبر مجموعة تُقارن صفوفها (المجموعات الأكبر كلمتها شائعة وغير مميزة)
+MAX_BLOCK_SIZE = 100
+# وزن تشابه الاسم في الدرجة (والباقي لتشابه العنوان)
+NAME_WEIGHT = 0.7
+
+# أعمدة تقسيم الصفوف إلى مجموعات
+BLOCK_COLUMNS = ['عنوان المنشأة (المحافظة)', 'عنوان المنشأة (المنطقة / المدينة)']
+
+# فاصل بين قيم الأعمدة في مفتاح المجموعة
+_KEY_SEPARATOR = '\x00'
+
+
+def _joined_text(data, columns, separator=' '):
+    """النص الموحد لعدة أعمدة في كل صف بدون تكرار القيم المتطابقة"""
+    if not columns:
+        return pd.Series('', index=data.index)
+    normalized = [data[col].map(normalize_text).astype(object) for col in columns]
+    rows = zip(*normalized)
+    return pd.Series(
+        [separator.join(dict.fromkeys(value for value in row if value)) for row in rows],
+        index=data.index
+    )
+
+
+def candidate_pairs(blocks, names, max_block_size=MAX_BLOCK_SIZE):
+    """أزواج الصفوف التي تشترك في المجموعة وفي كلمة واحدة على الأقل من الاسم"""
+    tokens = pd.DataFrame({
+        'label': names.index,
+        'block': blocks.to_numpy(),
+        'token': [sorted(set(tokenize(name))) for name in names],
+    }).explode('token').dropna(subset=['token'])
+    tokens = tokens[tokens['token'].str.len() >= 2]
+
+    groups = tokens.groupby(['block', 'token'], sort=False)['label']
+    sizes = groups.transform('size')
+    tokens = tokens[(sizes >= 2) & (sizes <= max_block_size)]
+
+    pairs = set()
+    for labels in tokens.groupby(['block', 'token'], sort=False)['label']:
+        pairs.update(combinations(sorted(labels[1]), 2))
+    return pairs
+
+
+def find_duplicates(data, code_column, name_columns, block_columns=BLOCK_COLUMNS, address_columns=(),
+                    threshold=DUPLICATE_THRESHOLD, max_block_size=MAX_BLOCK_SIZE):
+    """أزواج الصفوف المحتمل أنها لنفس المنشأة مرتبة من الأعلى تشابهاً"""
+    columns = ['الصف 1', 'الصف 2', 'الكود 1', 'الكود 2', 'الاسم 1', 'الاسم 2',
+               'العنوان 1', 'العنوان 2', 'تشابه الاسم', 'تشابه العنوان', 'الدرجة']
+    name_columns = [col for col in name_columns if col in data.columns]
+    if data.empty or not name_columns:
+        return pd.DataFrame(columns=columns)
+    block_columns = [col for col in block_columns if col in data.columns]
+    address_columns = [col for col in address_columns if col in data.columns and col not in block_columns]
+
+    names = _joined_text(data, name_columns)
+    addresses = _joined_text(data, address_columns)
+    blocks = _joined_text(data, block_columns, _KEY_SEPARATOR)
+
+    address_weight = 1 - NAME_WEIGHT if address_columns else 0.0
+    name_weight = 1 - address_weight
+    results = []
+    for first, second in candidate_pairs(blocks, names, max_block_size):
+        matcher = SequenceMatcher(None, names[first], names[second])
+        # تجاوز الأزواج التي لا تصل للحد حتى مع تطابق العنوان الكامل
+        if name_weight * matcher.quick_ratio() + address_weight < threshold:
+            continue
+        name_score = matcher.ratio()
+        if name_weight * name_score + address_weight < threshold:
+            continue
+        address_score = 1.0
+        if address_weight:
+            address_score = SequenceMatcher(None, addresses[first], addresses[second]).ratio()
+        score = name_weight * name_score + address_weight * address_score
+        if score >= threshold:
+            results.append((first, second, name_score, address_score, score))
+
+    if not results:
+        return pd.DataFrame(columns=columns)
+    pairs = pd.DataFrame(results, columns=['الصف 1', 'الصف 2', 'تشابه الاسم', 'تشابه العنوان', 'الدرجة'])
+    for suffix in ('1', '2'):
+        labels = pairs[f'الصف {suffix}']
+        pairs[f'الكود {suffix}'] = data[code_column].reindex(labels).to_numpy() if code_column in data.columns else None
+        pairs[f'الاسم {suffix}'] = data[name_columns[0]].reindex(labels).to_numpy()
+        pairs[f'العنوان {suffix}'] = addresses.reindex(labels).to_numpy()
+    pairs[['تشابه الاسم', 'تشابه العنوان', 'الدرجة']] = pairs[['تشابه الاسم', 'تشابه العنوان', 'الدرجة']].round(3)
+    return pairs[columns].sort_values('الدرجة', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=DATA_SOURCES, help="رابط أو مسار ملف البيانات (افتراضياً مصادر FOOD_SAFETY_SOURCES)")
+    parser.add_argument('--threshold', type=float, default=DUPLICATE_THRESHOLD)
+    parser.add_argument('--max-block-size', type=int, default=MAX_BLOCK_SIZE)
+    parser.add_argument('--output', default='duplicates.csv')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data = fetch_sheet(args.source)
+    schema = resolve_schema(data)
+    duplicates = find_duplicates(
+        data, schema.search_column, schema['names'], BLOCK_COLUMNS, schema['addresses'],
+        threshold=args.threshold, max_block_size=args.max_block_size
+    )
+    duplicates.to_csv(args.output, index=False, encoding='utf-8-sig')
+    print(f"{len(duplicates)} pairs from {len(data)} rows in {time.perf_counter() - started:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
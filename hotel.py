@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import requests
 from PIL import Image
@@ -9,6 +10,19 @@ import json
 from urllib.parse import urlparse
 from datetime import datetime
 
+from search_index import (
+    CodeIndex, TrigramIndex, BM25Index, FuzzyIndex, FacetIndex, PrefixIndex, QueryCache, labels_to_bits,
+    MODE_CODE, MODE_CONTAINS, MODE_RANKED, normalize_code, normalize_text
+)
+from cards import CardCache, card_columns, render_facility_card, status_classes
+from data_store import DATA_SOURCES, SOURCE_COLUMN, SnapshotStore, DatasetRefresher, memory_report
+from aggregates import AggregationCube
+from data_quality import profile_dataset
+from duplicates import BLOCK_COLUMNS, find_duplicates
+from bulk_lookup import code_lookup_table, parse_code_text, read_code_file, verify_codes
+from api import API_PORT, FacilityAPI, api_columns
+from schema import CATEGORY_LABELS, REQUIRED_COLUMNS, resolve_schema
+
 # إعداد الصفحة
 st.set_page_config(
     page_title="الهيئة القومية لسلامة الغذاء",
@@ -52,6 +66,12 @@ st.markdown("""
         background: white;
         box-shadow: 0 4px 6px rgba(0,0,0,0.1);
     }
+    .card-grid {
+        display: grid;
+        grid-template-columns: repeat(3, 1fr);
+        gap: 15px;
+        margin: 10px 0;
+    }
     .search-box {
         background: white;
         padding: 20px;
@@ -101,6 +121,9 @@ st.markdown("""
             flex-direction: column;
             text-align: center;
         }
+        .card-grid {
+            grid-template-columns: 1fr;
+        }
     }
     </style>
 """, unsafe_allow_html=True)
@@ -144,128 +167,422 @@ else:
         </div>
     """, unsafe_allow_html=True)
 
-# تحميل البيانات من Google Sheets
-@st.cache_data(ttl=300)
-def load_data():
-    """تحميل البيانات من Google Sheets"""
+# الفترة بين تحديثات البيانات في الخلفية بالثواني
+data_refresh_seconds = 300
+
+# تصنيف الأعمدة وعمود البحث لنسخة البيانات (مرة واحدة لكل نسخة ولكل تخصيص)
+def get_schema(dataset, schema_overrides=None):
+    """إرجاع تصنيف الأعمدة الخاص بنسخة البيانات مع تخصيص المستخدم"""
+    schema_overrides = schema_overrides or {}
+    category_overrides = schema_overrides.get('categories', {})
+    search_column = schema_overrides.get('search_column')
+    return dataset.artifact(
+        ('schema', tuple(sorted(category_overrides.items())), search_column),
+        lambda: resolve_schema(dataset.data, category_overrides, search_column)
+    )
+
+# تحديث الفهرس للصفوف المتغيرة فقط عند وصول نسخة جديدة من البيانات
+def index_updater(columns):
+    """دالة تحديث الفهرس بقيم الأعمدة المحددة في الصفوف المتغيرة"""
+    return lambda index, changes: index.updated(*changes.columns(columns))
+
+# فهرس الكود لنسخة البيانات (يُبنى مرة واحدة لكل نسخة، أو أثناء قراءة الملف)
+def get_code_index(dataset, search_column, prebuilt=None):
+    """إرجاع فهرس عمود البحث الخاص بنسخة البيانات"""
+    return dataset.artifact(
+        ('code_index', search_column),
+        (lambda: prebuilt) if prebuilt is not None
+        else lambda: CodeIndex(dataset.data[search_column].tolist(), dataset.data.index),
+        update=index_updater((search_column,))
+    )
+
+# فهرس المقاطع الثلاثية للبحث الجزئي في الكود والأسماء والعناوين
+def get_text_index(dataset, text_columns, prebuilt=None):
+    """إرجاع فهرس البحث الجزئي الخاص بنسخة البيانات"""
+    return dataset.artifact(
+        ('text_index', text_columns),
+        (lambda: prebuilt) if prebuilt is not None
+        else lambda: TrigramIndex([dataset.data[col].tolist() for col in text_columns], dataset.data.index),
+        update=index_updater(text_columns)
+    )
+
+# بناء فهرسي الكود والبحث الجزئي دفعة دفعة أثناء أول قراءة لملف البيانات
+def chunk_indexer():
+    """إرجاع دالة تضيف كل دفعة صفوف إلى الفهارس ودالة تسجلها في النسخة الجديدة"""
+    indexes = {}
+
+    def add_chunk(chunk):
+        if not indexes:
+            # تصنيف الأعمدة من أسماء أعمدة الدفعة الأولى
+            indexes['schema'] = resolve_schema(chunk)
+            indexes['code'] = CodeIndex([], [])
+            indexes['text'] = TrigramIndex([[] for _ in indexes['schema'].text_search_columns], [])
+        chunk_schema = indexes['schema']
+        indexes['code'].extend(chunk[chunk_schema.search_column].tolist(), chunk.index)
+        indexes['text'].extend([chunk[col].tolist() for col in chunk_schema.text_search_columns], chunk.index)
+
+    def seed(dataset):
+        if not indexes:
+            return
+        chunk_schema = indexes['schema']
+        schema = get_schema(dataset)
+        # الفهارس صالحة فقط إذا اختار تصنيف الجدول الكامل نفس الأعمدة
+        if chunk_schema.search_column == schema.search_column:
+            get_code_index(dataset, schema.search_column, prebuilt=indexes['code'])
+        if chunk_schema.text_search_columns == schema.text_search_columns:
+            get_text_index(dataset, schema.text_search_columns, prebuilt=indexes['text'])
+
+    return add_chunk, seed
+
+# فهرس البحث النصي المرتب (BM25) بعد توحيد النصوص العربية
+def get_ranked_index(dataset, text_columns):
+    """إرجاع فهرس الكلمات المرتب الخاص بنسخة البيانات"""
+    return dataset.artifact(
+        ('ranked_index', text_columns),
+        lambda: BM25Index([dataset.data[col].tolist() for col in text_columns], dataset.data.index),
+        update=index_updater(text_columns)
+    )
+
+# قاموس الاقتراحات للأخطاء الإملائية في الأكواد أو الأسماء
+def get_fuzzy_index(dataset, columns, is_code):
+    """إرجاع قاموس الحذف المسبق الخاص بنسخة البيانات"""
+    def build():
+        values = [value for col in columns for value in dataset.data[col].tolist()]
+        return FuzzyIndex(values, normalize=normalize_code if is_code else normalize_text)
+    return dataset.artifact(('fuzzy_index', columns, is_code), build, update=index_updater(columns))
+
+# اقتراحات الإكمال التلقائي من بداية الأكواد أو الأسماء
+def get_autocomplete_index(dataset, columns, is_code):
+    """إرجاع فهرس البدايات الخاص بنسخة البيانات"""
+    def build():
+        values = [value for col in columns for value in dataset.data[col].tolist()]
+        if is_code:
+            return PrefixIndex(values, normalize=normalize_code)
+        return PrefixIndex(values, word_starts=True)
+    return dataset.artifact(('autocomplete_index', columns, is_code), build, update=index_updater(columns))
+
+# أعمدة التصفية وأسماؤها المعروضة (الحالة محسوبة من عمود الحالة)
+facet_columns = ['عنوان المنشأة (المحافظة)', 'عنوان المنشأة (المنطقة / المدينة)', 'فئة المنشأة', SOURCE_COLUMN]
+status_facet = 'الحالة'
+facet_labels = {
+    'عنوان المنشأة (المحافظة)': 'المحافظة',
+    'عنوان المنشأة (المنطقة / المدينة)': 'المنطقة / المدينة',
+    'فئة المنشأة': 'فئة المنشأة',
+    SOURCE_COLUMN: 'المصدر (المديرية)',
+    status_facet: 'حالة القائمة البيضاء'
+}
+status_labels = {'good': 'مطابق', 'bad': 'غير مطابق', 'pending': 'قيد المراجعة'}
+
+def get_facet_columns(schema):
+    """أعمدة التصفية الموجودة في البيانات"""
+    columns = [col for col in facet_columns if col in schema]
+    if schema['statuses']:
+        columns.append(status_facet)
+    return columns
+
+def facet_values(data, schema):
+    """قيم أعمدة التصفية لصفوف الجدول بنفس ترتيب get_facet_columns"""
+    values = [data[col].tolist() for col in facet_columns if col in schema]
+    if schema['statuses']:
+        values.append(status_classes(data[schema['statuses'][0]]).tolist())
+    return values
+
+# خرائط بتات التصفية لنسخة البيانات (تُحدث للصفوف المتغيرة فقط)
+def get_facet_index(dataset, schema):
+    """إرجاع فهرس التصفية الخاص بنسخة البيانات"""
+    def update(index, changes):
+        return index.updated(
+            changes.removed, facet_values(changes.old_data.loc[changes.removed], schema),
+            changes.added, facet_values(changes.new_data.loc[changes.added], schema)
+        )
+    return dataset.artifact(
+        ('facet_index', schema.key),
+        lambda: FacetIndex(facet_values(dataset.data, schema), dataset.data.index),
+        update=update
+    )
+
+# مكعب عدد المنشآت حسب أبعاد التصفية لنسخة البيانات (يُحدث للصفوف المتغيرة فقط)
+def get_aggregation_cube(dataset, schema):
+    """إرجاع مكعب التجميع الخاص بنسخة البيانات"""
+    def update(cube, changes):
+        return cube.updated(
+            changes.removed, facet_values(changes.old_data.loc[changes.removed], schema),
+            changes.added, facet_values(changes.new_data.loc[changes.added], schema)
+        )
+    return dataset.artifact(
+        ('aggregation_cube', schema.key),
+        lambda: AggregationCube(facet_values(dataset.data, schema)),
+        update=update
+    )
+
+# أزواج المنشآت المحتمل تكرارها (مهمة أطول تُشغل عند الطلب مرة واحدة لكل نسخة)
+def get_duplicates(dataset, schema):
+    """إرجاع تقرير المنشآت المكررة الخاص بنسخة البيانات"""
+    return dataset.artifact(
+        ('duplicates', schema.key),
+        lambda: find_duplicates(
+            dataset.data, schema.search_column, schema['names'], BLOCK_COLUMNS, schema['addresses']
+        )
+    )
+
+# ترتيب صفوف الجدول حسب عمود (يُحسب مرة واحدة لكل عمود ولكل نسخة)
+def get_sort_order(dataset, column):
+    """إرجاع معرّفات الصفوف مرتبة تصاعدياً حسب العمود مع عدد القيم غير الفارغة"""
+    def build():
+        values = dataset.data[column]
+        order = values.sort_values(kind='stable', na_position='last').index.to_numpy()
+        return order, int(values.count())
+    return dataset.artifact(('sort_order', column), build)
+
+# ترتيب صفوف متصفح البيانات
+def sorted_labels(dataset, column, descending):
+    """معرّفات الصفوف بالترتيب المطلوب (القيم الفارغة في النهاية دائماً)"""
+    if column is None:
+        order = dataset.data.index.to_numpy()
+        return order[::-1] if descending else order
+    order, filled = get_sort_order(dataset, column)
+    if descending:
+        return np.concatenate([order[:filled][::-1], order[filled:]])
+    return order
+
+# عرض عوامل التصفية مع عدد الصفوف لكل قيمة
+def render_facet_filters(facet_index, facet_names, row_labels):
+    """رسم قوائم التصفية وإرجاع القيم المختارة لكل عمود
+
+    عدد كل قيمة يُحسب من خرائط البتات ضمن نتائج البحث وباقي عوامل التصفية.
+    """
+    if not facet_names:
+        return []
+    selections = [st.session_state.get(f"facet_{name}", []) for name in facet_names]
+    search_bits = facet_index.all_rows if row_labels is None else labels_to_bits(row_labels)
+    with st.expander("🧰 تصفية حسب المحافظة والمدينة والفئة والحالة", expanded=any(selections)):
+        filter_cols = st.columns(len(facet_names))
+        for position, name in enumerate(facet_names):
+            counts = facet_index.counts(position, facet_index.mask(selections, skip=position) & search_bits)
+            options = sorted(counts, key=lambda value: (-counts[value], value))
+            options += [value for value in selections[position] if value not in counts]
+            value_labels = status_labels if name == status_facet else {}
+            with filter_cols[position]:
+                st.multiselect(
+                    facet_labels[name],
+                    options,
+                    format_func=lambda value, counts=counts, value_labels=value_labels:
+                        f"{value_labels.get(value, value)} ({counts.get(value, 0)})",
+                    key=f"facet_{name}"
+                )
+    return selections
+
+# الحد الأقصى لبطاقات النتائج المعروضة مرة واحدة
+max_rendered_results = 200
+
+# عرض صفحة إضافية من نتائج البحث
+def show_more_results():
+    """زيادة عدد النتائج المعروضة بمقدار حجم الصفحة"""
+    st.session_state["results_shown"] += st.session_state["page_size"]
+
+# تغيير عمود البحث من الإعدادات
+def set_search_column():
+    """حفظ عمود البحث الذي اختاره المستخدم في تخصيص التصنيف"""
+    overrides = dict(st.session_state.get("schema_overrides", {}))
+    overrides['search_column'] = st.session_state["schema_search_column"]
+    st.session_state["schema_overrides"] = overrides
+
+# تغيير تصنيف عمود من الإعدادات
+def set_column_category(column):
+    """حفظ التصنيف الذي اختاره المستخدم للعمود"""
+    overrides = dict(st.session_state.get("schema_overrides", {}))
+    categories = dict(overrides.get('categories', {}))
+    categories[column] = st.session_state[f"schema_category_{column}"]
+    overrides['categories'] = categories
+    st.session_state["schema_overrides"] = overrides
+
+# استعادة التصنيف التلقائي للأعمدة
+def reset_schema_overrides():
+    """حذف تخصيص المستخدم لتصنيف الأعمدة وعمود البحث"""
+    st.session_state["schema_overrides"] = {}
+    for key in list(st.session_state):
+        if key == "schema_search_column" or str(key).startswith("schema_category_"):
+            del st.session_state[key]
+
+# تطبيق اقتراح "هل تقصد" على مربع البحث
+def apply_suggestion(value, mode):
+    """وضع القيمة المقترحة في مربع البحث مع طريقة البحث المناسبة"""
+    st.session_state["search_input"] = value
+    st.session_state["search_mode"] = mode
+
+# تحديث جدول الأعمدة المحسوبة بحساب الصفوف المتغيرة فقط
+def row_updater(build):
+    """دالة تحديث تحذف الصفوف المحذوفة وتحسب الصفوف المضافة ثم ترتبها كالجدول الجديد"""
+    def update(derived, changes):
+        added = build(changes.new_data.loc[changes.added])
+        return pd.concat([derived.drop(index=changes.removed), added]).reindex(changes.new_data.index)
+    return update
+
+# اسم المنشأة وحالتها وعنوانها الكامل لجميع الصفوف (محسوبة مرة واحدة لكل نسخة)
+def get_card_columns(dataset, schema):
+    """إرجاع الأعمدة المحسوبة للبطاقات الخاصة بنسخة البيانات"""
+    build = lambda data: card_columns(data, schema)
+    return dataset.artifact(
+        ('card_columns', schema.key),
+        lambda: build(dataset.data),
+        update=row_updater(build)
+    )
+
+# جدول ربط الأكواد الموحدة بالاسم والحالة والعنوان للتحقق الجماعي
+def get_code_lookup(dataset, schema):
+    """إرجاع جدول الأكواد الخاص بنسخة البيانات وتصنيف الأعمدة"""
+    return dataset.artifact(
+        ('code_lookup', schema.key),
+        lambda: code_lookup_table(
+            get_code_index(dataset, schema.search_column),
+            dataset.data[schema.search_column],
+            get_card_columns(dataset, schema)
+        )
+    )
+
+# ذاكرة البطاقات الجاهزة لنسخة البيانات (تنتقل بطاقات الصفوف غير المتغيرة للنسخة التالية)
+def get_card_cache(dataset):
+    """إرجاع ذاكرة البطاقات الخاصة بنسخة البيانات"""
+    return dataset.artifact(
+        'card_cache',
+        CardCache,
+        update=lambda cards, changes: cards.without_rows(changes.removed + changes.added)
+    )
+
+# تقرير جودة البيانات لنسخة البيانات (يُحسب مرة واحدة في خيط التحديث)
+def get_quality_report(dataset, schema):
+    """إرجاع تقرير الامتلاء والأكواد المكررة والمخالفة والقيم غير المتوقعة"""
+    category_columns = [col for col in facet_columns if col in schema] + schema['statuses'][:1]
+    return dataset.artifact(
+        ('quality_report', schema.key),
+        lambda: profile_dataset(dataset.data, schema.search_column, category_columns)
+    )
+
+# حجم أعمدة نسخة البيانات في الذاكرة قبل ضغط الأنواع وبعده
+def get_memory_report(dataset):
+    """إرجاع تقرير استهلاك الذاكرة مع حسابه مرة واحدة لكل نسخة"""
+    return dataset.artifact('memory_report', lambda: memory_report(dataset.data))
+
+# ملف CSV للتصدير لنسخة البيانات
+def get_export_csv(dataset):
+    """إرجاع البيانات بصيغة CSV مع بنائها مرة واحدة لكل نسخة"""
+    return dataset.artifact(
+        'export_csv',
+        lambda: dataset.data.to_csv(index=False, encoding='utf-8-sig')
+    )
+
+# تجهيز جميع فهارس البحث لنسخة جديدة قبل إتاحتها للمستخدمين
+def warm_indexes(dataset):
+    """بناء فهارس البحث مسبقاً في خيط التحديث"""
+    if dataset.data.empty:
+        return
+    schema = get_schema(dataset)
+    get_code_index(dataset, schema.search_column)
+    get_text_index(dataset, schema.text_search_columns)
+    if schema.ranked_search_columns:
+        get_ranked_index(dataset, schema.ranked_search_columns)
+    get_fuzzy_index(dataset, (schema.search_column,), True)
+    get_autocomplete_index(dataset, (schema.search_column,), True)
+    if schema['names']:
+        get_fuzzy_index(dataset, tuple(schema['names']), False)
+        get_autocomplete_index(dataset, tuple(schema['names']), False)
+    get_card_columns(dataset, schema)
+    get_facet_index(dataset, schema)
+    get_aggregation_cube(dataset, schema)
+    get_quality_report(dataset, schema)
+    if API_PORT:
+        api_columns(dataset, api_sources)
+
+# خيط تحديث البيانات في الخلفية (واحد لكل عملية)
+@st.cache_resource
+def get_refresher():
+    """تشغيل خيط تحديث البيانات مرة واحدة لكل عملية"""
+    return DatasetRefresher(
+        DATA_SOURCES, SnapshotStore(), interval=data_refresh_seconds, warmup=warm_indexes,
+        chunk_indexer=chunk_indexer
+    ).start()
+
+# فهرس الكود وأعمدة البطاقات التي تجيب منها واجهة JSON (نفس فهارس التطبيق)
+def api_sources(dataset):
+    """إرجاع فهرس الكود وعمود الكود وأعمدة البطاقات لنسخة البيانات"""
+    schema = get_schema(dataset)
+    return (
+        get_code_index(dataset, schema.search_column),
+        dataset.data[schema.search_column],
+        get_card_columns(dataset, schema)
+    )
+
+# واجهة JSON للأنظمة الأخرى في نفس العملية (تعمل فقط عند تحديد FOOD_SAFETY_API_PORT)
+@st.cache_resource
+def get_api_server():
+    """تشغيل واجهة JSON مرة واحدة لكل عملية"""
+    if not API_PORT:
+        return None
     try:
-        # الرابط الجديد
-        sheet_url = "https://docs.google.com/spreadsheets/d/1EN0muIIOrV5tqRoY02SX2Q5DdRFEM_CGo1Es4xueCgA/export?format=csv"
-        data = pd.read_csv(sheet_url)
-        
-        # تنظيف أسماء الأعمدة
-        data.columns = data.columns.str.strip()
-        
-        return data
-        
-    except Exception as e:
-        st.error(f"❌ خطأ في تحميل البيانات: {e}")
-        return pd.DataFrame()
+        return FacilityAPI(get_refresher(), api_sources, port=int(API_PORT)).start()
+    except (OSError, ValueError) as e:
+        # المنفذ مستخدم أو غير صالح: يعمل التطبيق بدون الواجهة
+        st.warning(f"⚠️ تعذر تشغيل واجهة JSON على المنفذ {API_PORT}: {e}")
+        return None
 
-data = load_data()
+# نتائج البحث الأخيرة مشتركة بين جميع الجلسات (تُفرغ مع كل نسخة جديدة)
+@st.cache_resource
+def get_query_cache():
+    """إنشاء ذاكرة نتائج البحث مرة واحدة لكل عملية"""
+    return QueryCache()
 
-# دالة للعثور على أفضل عمود للبحث
-def find_best_search_column(data):
-    """العثور على أفضل عمود للبحث بناءً على الأعمدة المتوقعة"""
-    # البحث أولاً عن عمود "الكود المنشأة" كما طلب المستخدم
-    if 'الكود المنشأة' in data.columns:
-        return 'الكود المنشأة'
-    
-    possible_columns = [
-        'الكود الجديد', 'الكود', 'كود', 'رقم', 'ID', 'Code', 'code',
-        'كود المنشأة', 'رقم المنشأة', 'كود المنشأة'
-    ]
-    
-    for col in possible_columns:
-        if col in data.columns:
-            return col
-    
-    # إذا لم نجد أي عمود من القائمة، نستخدم أول عمود نصي
-    for col in data.columns:
-        if data[col].dtype == 'object':
-            return col
-    
-    # إذا فشل كل شيء، نستخدم أول عمود
-    return data.columns[0] if len(data.columns) > 0 else None
-
-# دالة لتصنيف الأعمدة بناءً على الأعمدة المطلوبة
-def classify_columns(data):
-    """تصنيف الأعمدة حسب نوعها مع التركيز على الأعمدة المطلوبة"""
-    column_categories = {
-        'codes': [],
-        'names': [],
-        'addresses': [],
-        'types': [],
-        'statuses': [],
-        'dates': [],
-        'other': []
-    }
-    
-    # الكلمات المفتاحية باللغة العربية مع التركيز على الأعمدة المطلوبة
-    name_keywords = ['اسم المنشأة بالبطاقة الضريبية', 'اسم المنشأة على اللافتة', 'اسم', 'name', 'Title', 'title', 'مسمى', 'شركة']
-    code_keywords = ['الكود المنشأة', 'كود', 'code', 'رقم', 'id', 'ID', 'رمز']
-    address_keywords = [
-        'عنوان المنشأة (المحافظة)',
-        'عنوان المنشأة (المنطقة / المدينة)',
-        'عنوان المنشأة (تفصيلياً)',
-        'عنوان', 'address', 'موقع', 'مكان', 'محافظة', 'مدينة', 'منطقة'
-    ]
-    type_keywords = ['فئة المنشأة', 'نوع', 'type', 'فئة', 'category', 'تصنيف']
-    status_keywords = ['حالة', 'status', 'موقف', 'قائمة', 'بيضاء', 'نتيجة']
-    date_keywords = ['تاريخ', 'date', 'وقت', 'time']
-    
-    # أعمدة يجب البحث عنها بشكل خاص
-    specific_columns = {
-        'فئة المنشأة': 'types',
-        'اسم المنشأة بالبطاقة الضريبية': 'names',
-        'اسم المنشأة على اللافتة': 'names',
-        'عنوان المنشأة (المحافظة)': 'addresses',
-        'عنوان المنشأة (المنطقة / المدينة)': 'addresses',
-        'عنوان المنشأة (تفصيلياً)': 'addresses'
-    }
-    
-    for col in data.columns:
-        col_lower = col.lower()
-        
-        # التحقق من الأعمدة المحددة أولاً
-        if col in specific_columns:
-            column_categories[specific_columns[col]].append(col)
-        elif any(keyword in col_lower for keyword in code_keywords):
-            column_categories['codes'].append(col)
-        elif any(keyword in col_lower for keyword in name_keywords):
-            column_categories['names'].append(col)
-        elif any(keyword in col_lower for keyword in address_keywords):
-            column_categories['addresses'].append(col)
-        elif any(keyword in col_lower for keyword in type_keywords):
-            column_categories['types'].append(col)
-        elif any(keyword in col_lower for keyword in status_keywords):
-            column_categories['statuses'].append(col)
-        elif any(keyword in col_lower for keyword in date_keywords):
-            column_categories['dates'].append(col)
-        else:
-            column_categories['other'].append(col)
-    
-    return column_categories
-
-# دالة للحصول على اسم المنشأة من الأعمدة المطلوبة
-def get_facility_name(row, name_columns):
-    """الحصول على اسم المنشأة من الأعمدة المحددة"""
-    for col in ['اسم المنشأة بالبطاقة الضريبية', 'اسم المنشأة على اللافتة']:
-        if col in row and pd.notna(row[col]) and str(row[col]).strip():
-            return row[col]
-    
-    # إذا لم توجد الأعمدة المحددة، البحث في أي عمود أسماء
-    for col in name_columns:
-        if col in row and pd.notna(row[col]) and str(row[col]).strip():
-            return row[col]
-    
-    return "منشأة غير معروفة"
+# البحث في الفهرس المناسب لطريقة البحث مع حفظ النتيجة في ذاكرة النتائج
+def search_labels(dataset, schema, search_term, search_mode):
+    """إرجاع معرّفات الصفوف المطابقة للبحث"""
+    if search_mode == MODE_CONTAINS:
+        columns = schema.text_search_columns
+        search = lambda: get_text_index(dataset, columns).search(search_term)
+    elif search_mode == MODE_RANKED:
+        columns = schema.ranked_search_columns
+        if not columns:
+            return []
+        search = lambda: get_ranked_index(dataset, columns).search(search_term)
+    else:
+        columns = (schema.search_column,)
+        search = lambda: get_code_index(dataset, schema.search_column).lookup(search_term)
+    normalize = normalize_code if search_mode == MODE_CODE else normalize_text
+    return get_query_cache().get_or_search(
+        dataset.version, (search_mode, columns, normalize(search_term)), search
+    )
+
+# تحميل البيانات من Google Sheets (النسخة الحالية دون انتظار الشبكة)
+refresher = get_refresher()
+api_server = get_api_server()
+
+# أول تحميل بدون نسخة محلية: عرض تقدم القراءة بدلاً من الانتظار بدون مؤشر
+if refresher.loading:
+    load_progress = st.progress(0.0, text="⏳ جاري تحميل البيانات...")
+    while refresher.current(timeout=0.25) is None and refresher.loading:
+        fraction, message = refresher.progress
+        load_progress.progress(fraction, text=f"⏳ {message or 'جاري تحميل البيانات'}...")
+    load_progress.empty()
+dataset = refresher.current()
+
+if dataset is None:
+    st.error(f"❌ خطأ في تحميل البيانات: {refresher.last_error}")
+    data = pd.DataFrame()
+else:
+    # الجدول والفهارس مشتركة بين جميع الجلسات؛ الجلسة تحصل على نسخة سطحية بدون نسخ البيانات
+    data = dataset.view()
+    # تصنيف الأعمدة محسوب مسبقاً لهذه النسخة ولتخصيص المستخدم
+    schema = get_schema(dataset, st.session_state.get("schema_overrides"))
+    if refresher.last_error is not None:
+        st.warning(
+            f"⚠️ تعذر تحديث البيانات ({refresher.last_error})، "
+            f"يتم عرض آخر نسخة محفوظة بتاريخ {dataset.loaded_at:%Y-%m-%d %H:%M}"
+        )
 
 # تبويبات التطبيق
-tab1, tab2, tab3 = st.tabs([
+tab1, tab2, tab3, tab4 = st.tabs([
     "🔍 البحث", 
     "📊 عرض البيانات",
-    "⚙️ الإعدادات"
+    "⚙️ الإعدادات",
+    "📋 التحقق الجماعي"
 ])
 
 with tab1:
@@ -274,35 +591,24 @@ with tab1:
     if data.empty:
         st.error("❌ لا توجد بيانات متاحة للبحث")
     else:
-        # تصنيف الأعمدة
-        column_categories = classify_columns(data)
-        
         # عرض معلومات عن الأعمدة
         st.info(f"📁 تم تحميل {len(data)} سجل مع {len(data.columns)} عمود")
         
-        # اختيار عمود البحث
-        search_column = find_best_search_column(data)
+        # عمود البحث من التصنيف المحسوب مسبقاً
+        search_column = schema.search_column
         
         if search_column == 'الكود المنشأة':
             st.success("✅ تم العثور على عمود 'الكود المنشأة' وسيتم استخدامه للبحث")
-        elif not column_categories['codes']:
+        elif schema.search_column_overridden:
+            st.info(f"ℹ️ سيتم البحث في العمود المختار من الإعدادات: **{search_column}**")
+        elif not schema['codes']:
             st.warning(f"⚠️ لم يتم العثور على عمود 'الكود المنشأة'. سيتم استخدام العمود: **{search_column}** للبحث")
         else:
             st.info(f"ℹ️ سيتم البحث في عمود: **{search_column}**")
         
         # عرض الأعمدة المطلوبة الموجودة
-        required_columns = [
-            'فئة المنشأة',
-            'اسم المنشأة بالبطاقة الضريبية',
-            'اسم المنشأة على اللافتة',
-            'عنوان المنشأة (المحافظة)',
-            'عنوان المنشأة (المنطقة / المدينة)',
-            'عنوان المنشأة (تفصيلياً)'
-        ]
-        
-        found_columns = [col for col in required_columns if col in data.columns]
-        if found_columns:
-            st.success(f"✅ تم العثور على {len(found_columns)} من الأعمدة المطلوبة")
+        if schema.required_found:
+            st.success(f"✅ تم العثور على {len(schema.required_found)} من الأعمدة المطلوبة")
         
         # مربع البحث
         st.markdown("""
@@ -318,114 +624,134 @@ with tab1:
             key="search_input"
         )
         
+        # إكمال تلقائي من بداية الأكواد والأسماء (الأكثر تكراراً أولاً)
+        if search_term:
+            search_key = normalize_text(search_term)
+            completions = [
+                ("🔢", value, MODE_CODE)
+                for value, count in get_autocomplete_index(dataset, (search_column,), True).complete(search_term)
+            ]
+            if schema['names']:
+                completions += [
+                    ("🏢", value, MODE_CONTAINS)
+                    for value, count in get_autocomplete_index(dataset, tuple(schema['names']), False).complete(search_term)
+                ]
+            completions = [item for item in completions if normalize_text(item[1]) != search_key]
+            if completions:
+                st.caption("💡 إكمال البحث:")
+                completion_cols = st.columns(min(len(completions), 5))
+                for position, (icon, value, mode) in enumerate(completions):
+                    with completion_cols[position % len(completion_cols)]:
+                        st.button(f"{icon} {value}", key=f"complete_{mode}_{value}",
+                                  on_click=apply_suggestion, args=(value, mode))
+        
+        search_modes = {
+            MODE_CODE: "الكود كاملاً أو بدايته (سريع)",
+            MODE_CONTAINS: "جزء من الكود أو الاسم أو العنوان",
+            MODE_RANKED: "كلمات من الاسم أو العنوان (الأقرب أولاً)"
+        }
+        search_mode = st.radio(
+            "طريقة البحث:",
+            list(search_modes),
+            format_func=search_modes.get,
+            horizontal=True,
+            key="search_mode"
+        )
+        
+        page_size = st.selectbox(
+            "عدد النتائج في كل صفحة:",
+            [10, 20, 50, 100],
+            key="page_size"
+        )
+        
+        # نتائج البحث قبل التصفية (None تعني جميع الصفوف)
+        row_labels = None
+        search_error = None
         if search_term:
-            # البحث في العمود المحدد
+            # البحث في الفهرس المناسب (أو من ذاكرة النتائج لنفس النص في نفس النسخة)
             try:
-                filtered_data = data[data[search_column].astype(str).str.contains(search_term, case=False, na=False)]
+                row_labels = search_labels(dataset, schema, search_term, search_mode)
+            except Exception as e:
+                search_error = e
+                row_labels = []
+        
+        # التصفية حسب المحافظة والمدينة والفئة والحالة (AND بين خرائط البتات)
+        facet_index = get_facet_index(dataset, schema)
+        facet_selections = render_facet_filters(facet_index, get_facet_columns(schema), row_labels)
+        filtering = any(facet_selections)
+        if filtering:
+            facet_bits = facet_index.mask(facet_selections)
+            if row_labels is None:
+                row_labels = facet_index.labels(facet_bits)
+            else:
+                row_labels = facet_index.filter(row_labels, facet_bits)
+        
+        # إعادة ضبط عدد النتائج المعروضة عند تغيير البحث أو التصفية
+        query_signature = (search_term, search_mode, page_size, tuple(map(tuple, facet_selections)))
+        if st.session_state.get("results_query") != query_signature:
+            st.session_state["results_query"] = query_signature
+            st.session_state["results_shown"] = page_size
+        
+        if search_error is not None:
+            st.error(f"❌ خطأ في البحث: {search_error}")
+        elif row_labels is not None:
+            try:
+                total_results = len(row_labels)
                 
-                if len(filtered_data) == 0:
+                if total_results == 0 and filtering:
+                    st.warning("⚠️ لا توجد نتائج تطابق البحث مع عوامل التصفية المختارة")
+                elif total_results == 0:
                     st.warning("⚠️ لم يتم العثور على نتائج تطابق البحث")
                     
-                    # اقتراح بحث في أعمدة أخرى
-                    st.info("💡 جرب البحث في أعمدة أخرى:")
-                    for col in data.columns[:5]:
-                        if col != search_column:
-                            sample = data[col].dropna().head(3).tolist()
-                            sample_str = ", ".join([str(x) for x in sample[:2]])
-                            if len(sample) > 2:
-                                sample_str += "..."
-                            st.write(f"- **{col}** (مثال: {sample_str})")
+                    # اقتراح أقرب الأكواد والأسماء في حالة الخطأ الإملائي
+                    code_suggestions = get_fuzzy_index(dataset, (search_column,), True).suggest(search_term)
+                    name_suggestions = []
+                    if schema['names']:
+                        name_suggestions = get_fuzzy_index(
+                            dataset, tuple(schema['names']), False
+                        ).suggest(search_term)
+                    
+                    if code_suggestions or name_suggestions:
+                        st.info("💡 هل تقصد:")
+                        for value, distance in code_suggestions:
+                            st.button(f"🔢 {value}", key=f"suggest_code_{value}",
+                                      on_click=apply_suggestion, args=(value, MODE_CODE))
+                        for value, distance in name_suggestions:
+                            st.button(f"🏢 {value}", key=f"suggest_name_{value}",
+                                      on_click=apply_suggestion, args=(value, MODE_CONTAINS))
+                    else:
+                        # اقتراح بحث في أعمدة أخرى
+                        st.info("💡 جرب البحث في أعمدة أخرى:")
+                        for col in data.columns[:5]:
+                            if col != search_column:
+                                sample = data[col].dropna().head(3).tolist()
+                                sample_str = ", ".join([str(x) for x in sample[:2]])
+                                if len(sample) > 2:
+                                    sample_str += "..."
+                                st.write(f"- **{col}** (مثال: {sample_str})")
                 else:
-                    st.success(f"🎉 تم العثور على {len(filtered_data)} نتيجة")
+                    # عرض الصفحات المطلوبة فقط بدلاً من جميع النتائج
+                    results_shown = min(st.session_state["results_shown"], total_results, max_rendered_results)
+                    st.success(f"🎉 تم العثور على {total_results} نتيجة (يتم عرض {results_shown})")
                     
-                    for idx, row in filtered_data.iterrows():
-                        with st.container():
-                            st.markdown('<div class="facility-card">', unsafe_allow_html=True)
-                            
-                            # الحصول على اسم المنشأة
-                            facility_name = get_facility_name(row, column_categories['names'])
-                            
-                            # عرض الكود أولاً
-                            code_value = "غير محدد"
-                            if search_column in row:
-                                code_value = row[search_column]
-                            
-                            st.subheader(f"🏢 {facility_name}")
-                            st.write(f"**الكود:** {code_value}")
-                            
-                            # عرض المعلومات في أعمدة
-                            col1, col2, col3 = st.columns(3)
-                            
-                            with col1:
-                                st.write("**فئة المنشأة:**")
-                                if 'فئة المنشأة' in row and pd.notna(row['فئة المنشأة']):
-                                    st.write(f"**{row['فئة المنشأة']}**")
-                                else:
-                                    st.write("غير محدد")
-                                
-                                st.write("**أسماء المنشأة:**")
-                                name_fields = []
-                                if 'اسم المنشأة بالبطاقة الضريبية' in row and pd.notna(row['اسم المنشأة بالبطاقة الضريبية']):
-                                    name_fields.append(f"الضريبي: {row['اسم المنشأة بالبطاقة الضريبية']}")
-                                if 'اسم المنشأة على اللافتة' in row and pd.notna(row['اسم المنشأة على اللافتة']):
-                                    name_fields.append(f"اللافتة: {row['اسم المنشأة على اللافتة']}")
-                                
-                                if name_fields:
-                                    for name_field in name_fields:
-                                        st.write(f"• {name_field}")
-                                else:
-                                    st.write("غير متوفر")
-                            
-                            with col2:
-                                st.write("**العنوان:**")
-                                address_parts = []
-                                
-                                if 'عنوان المنشأة (المحافظة)' in row and pd.notna(row['عنوان المنشأة (المحافظة)']):
-                                    address_parts.append(f"**المحافظة:** {row['عنوان المنشأة (المحافظة)']}")
-                                
-                                if 'عنوان المنشأة (المنطقة / المدينة)' in row and pd.notna(row['عنوان المنشأة (المنطقة / المدينة)']):
-                                    address_parts.append(f"**المنطقة/المدينة:** {row['عنوان المنشأة (المنطقة / المدينة)']}")
-                                
-                                if 'عنوان المنشأة (تفصيلياً)' in row and pd.notna(row['عنوان المنشأة (تفصيلياً)']):
-                                    address_parts.append(f"**التفاصيل:** {row['عنوان المنشأة (تفصيلياً)']}")
-                                
-                                if address_parts:
-                                    for part in address_parts:
-                                        st.write(part)
-                                else:
-                                    # البحث في أي عمود عناوين آخر
-                                    for addr_col in column_categories['addresses'][:2]:
-                                        if addr_col in row and pd.notna(row[addr_col]):
-                                            st.write(f"**{addr_col}:** {row[addr_col]}")
-                                    if len(column_categories['addresses']) == 0:
-                                        st.write("غير متوفر")
-                            
-                            with col3:
-                                st.write("**الحالة والإضافات:**")
-                                # عرض الحالة إذا موجودة
-                                if column_categories['statuses']:
-                                    status_col = column_categories['statuses'][0]
-                                    if status_col in row:
-                                        status_value = row[status_col]
-                                        if any(word in str(status_value).lower() for word in ['مطابق', 'نعم', 'جيد', 'موافق']):
-                                            st.markdown(f"**الحالة:** <span class='white-list-good'>مطابق</span>", unsafe_allow_html=True)
-                                        elif any(word in str(status_value).lower() for word in ['غير', 'لا', 'رفض', 'مخالف']):
-                                            st.markdown(f"**الحالة:** <span class='white-list-bad'>غير مطابق</span>", unsafe_allow_html=True)
-                                        else:
-                                            st.markdown(f"**الحالة:** <span class='white-list-pending'>قيد المراجعة</span>", unsafe_allow_html=True)
-                                else:
-                                    st.write("**الحالة:** غير محددة")
-                                
-                                st.write("**حالة السجل:** نشط")
-                            
-                            # زر لتوسيع وعرض جميع البيانات
-                            with st.expander("📋 عرض جميع بيانات المنشأة"):
-                                st.write("**جميع البيانات:**")
-                                for col in data.columns:
-                                    if pd.notna(row[col]) and str(row[col]).strip():
-                                        st.write(f"**{col}:** {row[col]}")
-                            
-                            st.markdown('</div>', unsafe_allow_html=True)
+                    # كل بطاقة جزء HTML واحد محفوظ حسب نسخة البيانات وتصنيف الأعمدة ومعرّف الصف
+                    card_cache = get_card_cache(dataset)
+                    cards = get_card_columns(dataset, schema)
+                    for row_label in row_labels[:results_shown]:
+                        card_html = card_cache.get_or_render(
+                            (schema.key, row_label),
+                            lambda: render_facility_card(data.loc[row_label], cards.loc[row_label], schema)
+                        )
+                        st.markdown(card_html, unsafe_allow_html=True)
+                    
+                    if results_shown < min(total_results, max_rendered_results):
+                        st.button(
+                            f"⬇️ عرض المزيد ({total_results - results_shown} متبقية)",
+                            key="show_more_results",
+                            on_click=show_more_results
+                        )
+                    elif results_shown < total_results:
+                        st.info(f"ℹ️ تم عرض أول {max_rendered_results} نتيجة فقط، يرجى تحديد البحث أكثر")
                             
             except Exception as e:
                 st.error(f"❌ خطأ في البحث: {e}")
@@ -443,48 +769,140 @@ with tab2:
             st.metric("إجمالي السجلات", len(data))
         with col2:
             st.metric("عدد الأعمدة", len(data.columns))
+        quality = get_quality_report(dataset, schema)
+        non_empty = quality.columns.set_index('العمود')['مملوء']
         with col3:
-            non_empty = data.count()
             st.metric("أعلى عمود مملوء", f"{non_empty.max()}/{len(data)}")
         with col4:
             st.metric("أقل عمود مملوء", f"{non_empty.min()}/{len(data)}")
         
+        # لوحة المؤشرات من مكعب التجميع (بدون تجميع الجدول الكامل في كل تشغيل)
+        dimensions = get_facet_columns(schema)
+        if dimensions:
+            st.subheader("📈 لوحة المؤشرات")
+            dimension_names = [facet_labels[name] for name in dimensions]
+            cube = get_aggregation_cube(dataset, schema).frame(dimension_names)
+            status_name = facet_labels[status_facet]
+            if status_facet in dimensions:
+                cube[status_name] = cube[status_name].map(status_labels).fillna(cube[status_name])
+            
+            # التعمق من مستوى المحافظات إلى مدن المحافظة المختارة
+            group_name = dimension_names[0]
+            if len(dimension_names) > 1 and dimensions[0] == facet_columns[0]:
+                governorates = sorted(cube[group_name].unique())
+                drill_down = st.selectbox(
+                    f"{group_name}:", ["الكل"] + governorates, key="dashboard_drill_down"
+                )
+                if drill_down != "الكل":
+                    cube = cube[cube[group_name] == drill_down]
+                    if dimensions[1] == facet_columns[1]:
+                        group_name = dimension_names[1]
+            
+            if status_facet in dimensions:
+                status_totals = cube.groupby(status_name)['العدد'].sum()
+                total = status_totals.sum()
+                status_cols = st.columns(len(status_labels))
+                for status_col, label in zip(status_cols, status_labels.values()):
+                    with status_col:
+                        count = int(status_totals.get(label, 0))
+                        st.metric(label, count, f"{count / total:.0%}" if total else None, delta_color="off")
+            
+            breakdown_name = facet_labels['فئة المنشأة'] if 'فئة المنشأة' in dimensions else None
+            if breakdown_name and breakdown_name != group_name:
+                st.write(f"**عدد المنشآت حسب {group_name} و{breakdown_name}:**")
+                st.bar_chart(cube.pivot_table(
+                    index=group_name, columns=breakdown_name, values='العدد', aggfunc='sum', fill_value=0
+                ))
+            else:
+                st.bar_chart(cube.groupby(group_name)['العدد'].sum())
+            
+            if status_facet in dimensions and status_name != group_name:
+                with st.expander(f"📋 نسب حالة القائمة البيضاء حسب {group_name}"):
+                    ratios = cube.pivot_table(
+                        index=group_name, columns=status_name, values='العدد', aggfunc='sum', fill_value=0
+                    )
+                    ratios = ratios.div(ratios.sum(axis=1), axis=0).mul(100).round(1)
+                    st.dataframe(ratios, use_container_width=True)
+        
+        # تقرير جودة البيانات المحسوب مسبقاً لهذه النسخة
+        st.subheader("🩺 جودة البيانات")
+        quality_cols = st.columns(3)
+        with quality_cols[0]:
+            st.metric("أكواد مكررة", len(quality.duplicate_codes))
+        with quality_cols[1]:
+            st.metric("أكواد بشكل غير متوقع", len(quality.malformed_codes))
+        with quality_cols[2]:
+            st.metric("قيم غير متوقعة", len(quality.unexpected_values))
+        with st.expander("📏 امتلاء الأعمدة والقيم المختلفة"):
+            st.dataframe(quality.columns, hide_index=True, use_container_width=True)
+        if len(quality.duplicate_codes):
+            with st.expander(f"🔁 الأكواد المكررة ({len(quality.duplicate_codes)})"):
+                st.dataframe(quality.duplicate_codes.head(1000), hide_index=True, use_container_width=True)
+        if len(quality.malformed_codes):
+            with st.expander(f"⚠️ أكواد لا تطابق الشكل المعتاد `{quality.expected_code_shape}` ({len(quality.malformed_codes)})"):
+                st.caption("الشكل: كل سلسلة أرقام تظهر 9 وكل سلسلة حروف تظهر A")
+                st.dataframe(quality.malformed_codes.head(1000), hide_index=True, use_container_width=True)
+        if len(quality.unexpected_values):
+            with st.expander(f"❓ قيم نادرة أو مكتوبة بأكثر من شكل ({len(quality.unexpected_values)})"):
+                st.dataframe(quality.unexpected_values, hide_index=True, use_container_width=True)
+        
+        # المنشآت المسجلة أكثر من مرة بأكواد مختلفة
+        st.subheader("👥 المنشآت المحتمل تكرارها")
+        duplicates = dataset.cached_artifact(('duplicates', schema.key))
+        if duplicates is None and st.button("🔍 فحص المنشآت المكررة"):
+            with st.spinner("⏳ جاري مقارنة المنشآت المتشابهة..."):
+                duplicates = get_duplicates(dataset, schema)
+        if duplicates is not None:
+            if duplicates.empty:
+                st.success("✅ لم يتم العثور على منشآت محتمل تكرارها")
+            else:
+                st.warning(f"⚠️ تم العثور على {len(duplicates)} زوج من المنشآت المحتمل تكرارها")
+                st.dataframe(duplicates.head(1000), hide_index=True, use_container_width=True)
+                st.download_button(
+                    label="📥 تحميل تقرير التكرار",
+                    data=duplicates.to_csv(index=False, encoding='utf-8-sig'),
+                    file_name="المنشآت_المكررة.csv",
+                    mime="text/csv"
+                )
+        
+        # حجم البيانات في الذاكرة بعد ضغط أنواع الأعمدة
+        st.subheader("💾 حجم البيانات في الذاكرة")
+        memory = get_memory_report(dataset)
+        before_mb = memory['قبل (ميجابايت)'].sum()
+        after_mb = memory['بعد (ميجابايت)'].sum()
+        mem_col1, mem_col2, mem_col3 = st.columns(3)
+        with mem_col1:
+            st.metric("قبل ضغط الأنواع", f"{before_mb:.2f} MB")
+        with mem_col2:
+            st.metric("بعد ضغط الأنواع", f"{after_mb:.2f} MB")
+        with mem_col3:
+            saved = (1 - after_mb / before_mb) * 100 if before_mb else 0
+            st.metric("التوفير", f"{saved:.0f}%")
+        with st.expander("📏 الحجم لكل عمود"):
+            st.dataframe(memory, hide_index=True, use_container_width=True)
+        
         # عرض الأعمدة المطلوبة
         st.subheader("🎯 الأعمدة المطلوبة")
-        required_columns = [
-            'فئة المنشأة',
-            'اسم المنشأة بالبطاقة الضريبية',
-            'اسم المنشأة على اللافتة',
-            'عنوان المنشأة (المحافظة)',
-            'عنوان المنشأة (المنطقة / المدينة)',
-            'عنوان المنشأة (تفصيلياً)'
-        ]
-        
         req_cols = st.columns(3)
         col_idx = 0
         
-        for col in required_columns:
+        for col in REQUIRED_COLUMNS:
             with req_cols[col_idx % 3]:
-                if col in data.columns:
+                if col in schema:
                     st.success(f"✅ {col}")
-                    non_null = data[col].count()
+                    non_null = non_empty[col]
                     st.caption(f"({non_null}/{len(data)} سجل)")
                 else:
                     st.error(f"❌ {col}")
             col_idx += 1
         
         # عرض تصنيف الأعمدة
-        column_categories = classify_columns(data)
-        
         st.subheader("📂 تصنيف الأعمدة")
         cat_cols = st.columns(5)
         
         categories = [
-            ('أكواد', column_categories['codes']),
-            ('أسماء', column_categories['names']),
-            ('عناوين', column_categories['addresses']),
-            ('أنواع', column_categories['types']),
-            ('أخرى', column_categories['other'])
+            (CATEGORY_LABELS[category], schema[category])
+            for category in ['codes', 'names', 'addresses', 'types', 'other']
         ]
         
         for idx, (cat_name, cat_columns) in enumerate(categories):
@@ -495,9 +913,48 @@ with tab2:
                 if len(cat_columns) > 5:
                     st.write(f"و {len(cat_columns) - 5} أكثر...")
         
-        # عرض البيانات الكاملة
+        # متصفح البيانات: الترتيب والتصفية والتقسيم إلى صفحات على الخادم
+        # حتى يُرسل للمتصفح الصفوف الظاهرة فقط بدلاً من الجدول كاملاً
         st.subheader("📋 البيانات الكاملة")
-        st.dataframe(data, use_container_width=True)
+        grid_cols = st.columns([2, 1, 2, 1])
+        with grid_cols[0]:
+            sort_column = st.selectbox(
+                "ترتيب حسب:",
+                [None] + list(data.columns),
+                format_func=lambda col: "ترتيب الملف" if col is None else col,
+                key="grid_sort_column"
+            )
+        with grid_cols[1]:
+            descending = st.toggle("تنازلي", key="grid_descending")
+        with grid_cols[2]:
+            grid_filter = st.text_input(
+                "تصفية الصفوف:",
+                placeholder="جزء من الكود أو الاسم أو العنوان...",
+                key="grid_filter"
+            )
+        with grid_cols[3]:
+            grid_page_size = st.selectbox("صفوف في الصفحة:", [25, 50, 100, 200], key="grid_page_size")
+        
+        row_order = sorted_labels(dataset, sort_column, descending)
+        if grid_filter:
+            matches = get_text_index(dataset, schema.text_search_columns).search(grid_filter)
+            row_order = row_order[np.isin(row_order, matches)]
+        
+        # العودة للصفحة الأولى عند تغيير الترتيب أو التصفية
+        grid_signature = (dataset.version, sort_column, descending, grid_filter, grid_page_size)
+        if st.session_state.get("grid_query") != grid_signature:
+            st.session_state["grid_query"] = grid_signature
+            st.session_state["grid_page"] = 1
+        
+        page_count = max(1, -(-len(row_order) // grid_page_size))
+        grid_page = st.number_input(f"الصفحة (من {page_count}):", 1, page_count, key="grid_page")
+        start = (grid_page - 1) * grid_page_size
+        window = row_order[start:start + grid_page_size]
+        if len(window):
+            st.caption(f"الصفوف {start + 1} - {start + len(window)} من {len(row_order)}")
+            st.dataframe(data.loc[window], use_container_width=True)
+        else:
+            st.info("ℹ️ لا توجد صفوف تطابق التصفية")
 
 with tab3:
     st.header("⚙️ الإعدادات والمساعدة")
@@ -508,32 +965,55 @@ with tab3:
         st.subheader("🛠️ أدوات النظام")
         
         if st.button("🔄 تحديث البيانات"):
-            st.cache_data.clear()
+            # جميع الجلسات التي تطلب التحديث معاً تنتظر عملية تحميل واحدة
+            with st.spinner("⏳ جاري تحديث البيانات..."):
+                refresher.refresh()
             st.rerun()
         
-        if st.button("📥 تصدير البيانات"):
-            csv = data.to_csv(index=False, encoding='utf-8-sig')
-            st.download_button(
-                label="📥 تحميل كملف CSV",
-                data=csv,
-                file_name="المنشآت_الغذائية.csv",
-                mime="text/csv"
-            )
+        # التصدير وتصنيف الأعمدة يحتاجان نسخة بيانات محملة
+        if dataset is not None:
+            if st.button("📥 تصدير البيانات"):
+                csv = get_export_csv(dataset)
+                st.download_button(
+                    label="📥 تحميل كملف CSV",
+                    data=csv,
+                    file_name="المنشآت_الغذائية.csv",
+                    mime="text/csv"
+                )
         
-        # عرض أعمدة البحث المتاحة
-        st.subheader("🔍 أعمدة البحث المتاحة")
-        search_column = find_best_search_column(data)
-        st.write(f"**عمود البحث الحالي:** {search_column}")
-        
-        # اختيار عمود بحث يدوي
-        if len(data.columns) > 0:
-            selected_col = st.selectbox(
-                "اختر عمود بحث آخر:",
-                data.columns,
-                index=list(data.columns).index(search_column) if search_column in data.columns else 0
-            )
-            if selected_col != search_column:
-                st.info(f"يمكنك استخدام عمود **{selected_col}** للبحث")
+            # عرض أعمدة البحث المتاحة
+            st.subheader("🔍 أعمدة البحث المتاحة")
+            search_column = schema.search_column
+            st.write(f"**عمود البحث الحالي:** {search_column}")
+        
+            # اختيار عمود بحث يدوي (يُطبق على تبويب البحث)
+            if len(data.columns) > 0:
+                st.selectbox(
+                    "اختر عمود بحث آخر:",
+                    data.columns,
+                    index=list(data.columns).index(search_column) if search_column in schema else 0,
+                    key="schema_search_column",
+                    on_change=set_search_column
+                )
+            
+                # تخصيص تصنيف الأعمدة التي لم يتعرف عليها النظام بشكل صحيح
+                with st.expander("🧭 تخصيص تصنيف الأعمدة"):
+                    override_column = st.selectbox("العمود:", data.columns, key="schema_override_column")
+                    categories = list(CATEGORY_LABELS)
+                    st.selectbox(
+                        "التصنيف:",
+                        categories,
+                        index=categories.index(schema.category_of[override_column]),
+                        format_func=CATEGORY_LABELS.get,
+                        key=f"schema_category_{override_column}",
+                        on_change=set_column_category,
+                        args=(override_column,)
+                    )
+                    if schema.category_overrides:
+                        for col, category in schema.category_overrides.items():
+                            st.write(f"- **{col}**: {CATEGORY_LABELS[category]}")
+                    if st.session_state.get("schema_overrides"):
+                        st.button("↩️ استعادة التصنيف التلقائي", on_click=reset_schema_overrides)
     
     with col2:
         st.subheader("📊 إحصائيات")
@@ -541,26 +1021,38 @@ with tab3:
         if not data.empty:
             st.write(f"**إجمالي السجلات:** {len(data)}")
             st.write(f"**عدد الأعمدة:** {len(data.columns)}")
-            st.write(f"**تاريخ التحميل:** {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+            st.write(f"**تاريخ التحميل:** {dataset.loaded_at.strftime('%Y-%m-%d %H:%M')}")
+            st.write(f"**نسخة البيانات:** `{dataset.version}`")
+            st.write(f"**عمر البيانات:** {int(dataset.age_seconds // 60)} دقيقة")
+            if dataset.from_snapshot:
+                st.write("**المصدر:** نسخة محلية محفوظة")
+            if len(refresher.sources) > 1:
+                st.write(f"**عدد ملفات المديريات:** {len(refresher.sources)}")
+            if refresher.last_changed_rows is not None:
+                st.write(f"**الصفوف المتغيرة في آخر تحديث:** {refresher.last_changed_rows}")
+            if refresher.last_checked_at is not None:
+                st.write(f"**آخر فحص للتحديثات:** {refresher.last_checked_at.strftime('%Y-%m-%d %H:%M')}")
+            
+            if api_server is not None:
+                st.write(f"**واجهة JSON:** تعمل على المنفذ {api_server.address[1]}")
+            
+            # كفاءة ذاكرة نتائج البحث المشتركة
+            cache_stats = get_query_cache().stats()
+            st.write(
+                f"**ذاكرة نتائج البحث:** {cache_stats['entries']} من {cache_stats['max_entries']} نتيجة، "
+                f"إصابة {cache_stats['hits']} / إخفاق {cache_stats['misses']} "
+                f"({cache_stats['hit_ratio']:.0%})، حذف {cache_stats['evictions']}"
+            )
             
             # معلومات عن الأعمدة المطلوبة
             st.write("**الأعمدة المطلوبة:**")
-            required_columns = [
-                'فئة المنشأة',
-                'اسم المنشأة بالبطاقة الضريبية',
-                'اسم المنشأة على اللافتة',
-                'عنوان المنشأة (المحافظة)',
-                'عنوان المنشأة (المنطقة / المدينة)',
-                'عنوان المنشأة (تفصيلياً)'
-            ]
-            
-            for col in required_columns[:5]:
-                if col in data.columns:
+            for col in REQUIRED_COLUMNS[:5]:
+                if col in schema:
                     st.success(f"✅ {col}")
                 else:
                     st.error(f"❌ {col}")
-            if len(required_columns) > 5:
-                st.write(f"و {len(required_columns) - 5} أعمدة أخرى...")
+            if len(REQUIRED_COLUMNS) > 5:
+                st.write(f"و {len(REQUIRED_COLUMNS) - 5} أعمدة أخرى...")
     
     st.subheader("📖 دليل الاستخدام")
     
@@ -590,6 +1082,69 @@ with tab3:
         سيقوم النظام بمحاولة التعرف على الأعمدة المشابهة تلقائياً.
         """)
 
+with tab4:
+    st.header("📋 التحقق من قائمة أكواد")
+    
+    if data.empty:
+        st.error("❌ لا توجد بيانات للتحقق منها")
+    else:
+        st.write(f"الأكواد تُطابق مع عمود **{schema.search_column}** بعد توحيد كتابتها.")
+        pasted_codes = st.text_area(
+            "الصق الأكواد (كود في كل سطر أو مفصولة بفواصل):",
+            key="bulk_codes_text",
+            height=150
+        )
+        uploaded_codes = st.file_uploader(
+            "أو ارفع ملف CSV أو Excel (xlsx) يحتوي على عمود الكود:",
+            type=["csv", "xlsx"],
+            key="bulk_codes_file"
+        )
+        
+        codes = parse_code_text(pasted_codes)
+        if uploaded_codes is not None:
+            try:
+                codes += read_code_file(uploaded_codes.name, uploaded_codes.getvalue())
+            except ImportError:
+                st.error("❌ قراءة ملفات Excel تتطلب تثبيت مكتبة openpyxl، يمكنك رفع الملف بصيغة CSV")
+            except Exception as e:
+                st.error(f"❌ تعذر قراءة الملف: {e}")
+        
+        if codes:
+            # جميع الأكواد تُطابق في عملية ربط واحدة مع جدول الأكواد المحسوب مسبقاً
+            result = verify_codes(codes, get_code_lookup(dataset, schema))
+            result['status_class'] = result['status_class'].astype(object).map(status_labels)
+            result = result.rename(columns={
+                'input': 'الكود المدخل',
+                'code': 'الكود',
+                'display_name': 'اسم المنشأة',
+                'status_class': 'الحالة',
+                'full_address': 'العنوان',
+            })
+            result['النتيجة'] = np.where(result.pop('found'), 'موجود', 'غير موجود')
+            result = result[['الكود المدخل', 'النتيجة', 'الكود', 'اسم المنشأة', 'الحالة', 'العنوان']]
+            
+            found = result['النتيجة'] == 'موجود'
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("الأكواد المدخلة", len(codes))
+            with col2:
+                st.metric("موجود", int(result.loc[found, 'الكود المدخل'].nunique()))
+            with col3:
+                st.metric("غير موجود", int(result.loc[~found, 'الكود المدخل'].nunique()))
+            
+            st.download_button(
+                label="📥 تحميل النتيجة (CSV)",
+                data=result.to_csv(index=False, encoding='utf-8-sig'),
+                file_name=f"verification_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                mime="text/csv"
+            )
+            # عرض جزء من النتيجة فقط، والملف المحمل يحتوي على جميع الصفوف
+            if len(result) > max_rendered_results:
+                st.caption(f"يتم عرض أول {max_rendered_results} صف من {len(result)}، حمّل الملف لعرض الكل")
+            st.dataframe(result.head(max_rendered_results), use_container_width=True)
+        else:
+            st.info("ℹ️ أدخل الأكواد أو ارفع ملفاً للتحقق منها")
+
 # تذييل الصفحة
 st.markdown("---")
 st.markdown(
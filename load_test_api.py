@@ -0,0 +1,102 @@
+"""اختبار تحميل لواجهة JSON: زمن الاستجابة وعدد الطلبات في الثانية على نسخة محلية
+
+يرسل طلبات GET /facility/<code> (أو POST /facilities على دفعات) من عدة خيوط
+متزامنة، لكل خيط اتصال مستمر واحد، بأكواد مأخوذة من نفس مصدر البيانات مع نسبة
+من الأكواد غير الموجودة.
+
+مثال:
+    python api.py --port 8600 &
+    python load_test_api.py --url http://127.0.0.1:8600 --requests 5000 --concurrency 16
+"""
+import argparse
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+from data_store import DATA_SOURCES, fetch_sheet
+from schema import resolve_schema
+
+
+# أكواد الاختبار من مصدر البيانات مع أكواد غير موجودة
+def sample_codes(source, count, missing_ratio):
+    """قائمة أكواد عشوائية بطول count"""
+    data = fetch_sheet(source)
+    codes = data[resolve_schema(data).search_column].dropna().astype(str).tolist()
+    return [
+        f"MISSING-{i}" if random.random() < missing_ratio else random.choice(codes)
+        for i in range(count)
+    ]
+
+
+# خيط واحد يرسل نصيبه من الطلبات على اتصال مستمر
+def run_worker(url, jobs, batch_size, timings, statuses, lock):
+    """إرسال الطلبات وتسجيل زمن كل طلب وحالته"""
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    local_timings = []
+    local_statuses = Counter()
+    for job in jobs:
+        started = time.perf_counter()
+        if batch_size > 1:
+            body = json.dumps({'codes': job}).encode('utf-8')
+            connection.request('POST', '/facilities', body, {'Content-Type': 'application/json'})
+        else:
+            connection.request('GET', '/facility/' + quote(job, safe=''))
+        response = connection.getresponse()
+        response.read()
+        local_timings.append(time.perf_counter() - started)
+        local_statuses[response.status] += 1
+    connection.close()
+    with lock:
+        timings.extend(local_timings)
+        statuses.update(local_statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8600')
+    parser.add_argument('--source', default=DATA_SOURCES, help="مصدر البيانات لاختيار الأكواد")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=1, help="أكثر من 1 يرسل POST /facilities")
+    parser.add_argument('--missing-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    codes = sample_codes(args.source, args.requests * args.batch_size, args.missing_ratio)
+    if args.batch_size > 1:
+        jobs = [codes[i:i + args.batch_size] for i in range(0, len(codes), args.batch_size)]
+    else:
+        jobs = codes
+
+    timings = []
+    statuses = Counter()
+    lock = threading.Lock()
+    workers = [
+        threading.Thread(
+            target=run_worker,
+            args=(args.url, jobs[i::args.concurrency], args.batch_size, timings, statuses, lock)
+        )
+        for i in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    percentile = lambda p: timings[min(len(timings) - 1, int(p * len(timings)))] * 1000
+    print(f"requests   {len(timings)} in {elapsed:.2f}s ({len(timings) / elapsed:.0f} req/s)")
+    print(f"statuses   {dict(sorted(statuses.items()))}")
+    print(f"latency ms p50 {percentile(0.50):.2f}  p95 {percentile(0.95):.2f}  "
+          f"p99 {percentile(0.99):.2f}  max {timings[-1] * 1000:.2f}  mean {statistics.mean(timings) * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""قياس استهلاك الذاكرة وزمن إعادة التشغيل مع زيادة عدد الجلسات المتزامنة
+
+يشغّل نفس الصفحة في عدة جلسات داخل نفس العملية (كما يفعل خادم Streamlit)
+ويقيس الذاكرة المقيمة للعملية وزمن كل إعادة تشغيل لكل جلسة، مرة بالجدول
+المشترك (st.cache_resource مع Dataset.view) ومرة بالطريقة السابقة
+(st.cache_data) التي تعطي كل إعادة تشغيل نسخة جديدة من الجدول. كل طريقة
+تُقاس في عملية مستقلة حتى لا تُحسب ذاكرة إحداهما للأخرى.
+
+مثال:
+    FOOD_SAFETY_SHEET_URL=data.csv python measure_sessions.py --sessions 1 10 25 50
+"""
+import argparse
+import gc
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+# طرق تحميل الجدول المقارنة (بنفس ترتيب الطباعة)
+MODES = {
+    'shared': "shared dataset (st.cache_resource)",
+    'copied': "per-session copies (st.cache_data)",
+}
+
+# دالة load() لكل طريقة: الفرق الوحيد بين الصفحتين المقاستين
+_LOADERS = {
+    'shared': '''
+from data_store import DATA_SOURCES, DatasetRefresher, SnapshotStore
+
+@st.cache_resource
+def get_refresher():
+    return DatasetRefresher(DATA_SOURCES, SnapshotStore()).start()
+
+def load():
+    return get_refresher().current().view()
+''',
+    'copied': '''
+from data_store import DATA_SOURCES, fetch_sheet
+
+@st.cache_data
+def load():
+    return fetch_sheet(DATA_SOURCES)
+''',
+}
+
+# نفس العمل في كل إعادة تشغيل للطريقتين: البحث في عمود الكود وعرض أول النتائج
+_PAGE = '''
+import streamlit as st
+from schema import resolve_schema
+{loader}
+data = load()
+search_column = resolve_schema(data).search_column
+search_term = st.text_input("بحث", key="search_input")
+if search_term:
+    matches = data[data[search_column].astype(str).str.contains(search_term, regex=False)]
+    st.write(len(matches))
+    st.dataframe(matches.head(10))
+'''
+
+
+# قراءة الذاكرة المقيمة الحالية للعملية بالميجابايت
+def resident_memory_mb():
+    """الذاكرة المقيمة للعملية (أو أعلى قيمة لها إذا لم يتوفر /proc)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return peak_memory_mb()
+
+
+# أعلى ذاكرة مقيمة للعملية منذ بدايتها بالميجابايت
+def peak_memory_mb():
+    """أعلى ذاكرة مقيمة (تشمل النسخ المؤقتة التي حُذفت بعد إعادة التشغيل)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# تشغيل الجلسات لطريقة تحميل واحدة داخل هذه العملية
+def measure_sessions(mode, session_counts, reruns, search_term):
+    """قياس الذاكرة وزمن إعادة التشغيل مع زيادة عدد الجلسات"""
+    from streamlit.testing.v1 import AppTest
+
+    page = _PAGE.format(loader=_LOADERS[mode])
+    sessions = []
+    results = []
+    for count in session_counts:
+        while len(sessions) < count:
+            session = AppTest.from_string(page, default_timeout=120)
+            session.run()
+            sessions.append(session)
+        gc.collect()
+
+        timings = []
+        for _ in range(reruns):
+            for session in sessions:
+                started = time.perf_counter()
+                session.text_input(key='search_input').input(search_term).run()
+                timings.append(time.perf_counter() - started)
+        results.append((count, resident_memory_mb(), peak_memory_mb(), statistics.median(timings)))
+    return results
+
+
+# طباعة جدول النتائج
+def print_results(title, baseline, results):
+    """طباعة عدد الجلسات والذاكرة وأعلى ذاكرة والزمن لكل قياس"""
+    print(title)
+    print(f"baseline rss_mb {baseline:.1f}")
+    print(f"{'sessions':>10} {'rss_mb':>10} {'peak_mb':>10} {'rerun_ms':>10}")
+    for count, memory, peak, latency in results:
+        print(f"{count:>10} {memory:>10.1f} {peak:>10.1f} {latency * 1000:>10.1f}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+    parser.add_argument('--reruns', type=int, default=3)
+    parser.add_argument('--search', default='1')
+    parser.add_argument('--mode', choices=list(MODES), help="قياس طريقة واحدة في هذه العملية")
+    args = parser.parse_args()
+
+    if args.mode is None:
+        # كل طريقة في عملية جديدة تبدأ من نفس الذاكرة
+        for mode in MODES:
+            command = [sys.executable, os.path.abspath(__file__), '--mode', mode,
+                       '--reruns', str(args.reruns), '--search', args.search,
+                       '--sessions', *[str(count) for count in args.sessions]]
+            subprocess.run(command, check=True)
+        return
+
+    baseline = resident_memory_mb()
+    results = measure_sessions(args.mode, sorted(args.sessions), args.reruns, args.search)
+    print_results(MODES[args.mode], baseline, results)
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
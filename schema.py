@@ -0,0 +1,176 @@
+"""تصنيف أعمدة جدول المنشآت مرة واحدة لكل نسخة من البيانات"""
+import re
+
+import pandas as pd
+
+# الأعمدة المطلوبة في بيانات المنشآت
+REQUIRED_COLUMNS = [
+    'فئة المنشأة',
+    'اسم المنشأة بالبطاقة الضريبية',
+    'اسم المنشأة على اللافتة',
+    'عنوان المنشأة (المحافظة)',
+    'عنوان المنشأة (المنطقة / المدينة)',
+    'عنوان المنشأة (تفصيلياً)'
+]
+
+# أعمدة يجب البحث عنها بشكل خاص
+SPECIFIC_COLUMNS = {
+    'فئة المنشأة': 'types',
+    'اسم المنشأة بالبطاقة الضريبية': 'names',
+    'اسم المنشأة على اللافتة': 'names',
+    'عنوان المنشأة (المحافظة)': 'addresses',
+    'عنوان المنشأة (المنطقة / المدينة)': 'addresses',
+    'عنوان المنشأة (تفصيلياً)': 'addresses'
+}
+
+# الكلمات المفتاحية لكل تصنيف بترتيب أولوية المطابقة
+CATEGORY_KEYWORDS = [
+    ('codes', ['الكود المنشأة', 'كود', 'code', 'رقم', 'id', 'ID', 'رمز']),
+    ('names', ['اسم المنشأة بالبطاقة الضريبية', 'اسم المنشأة على اللافتة', 'اسم', 'name', 'Title', 'title', 'مسمى', 'شركة']),
+    ('addresses', [
+        'عنوان المنشأة (المحافظة)',
+        'عنوان المنشأة (المنطقة / المدينة)',
+        'عنوان المنشأة (تفصيلياً)',
+        'عنوان', 'address', 'موقع', 'مكان', 'محافظة', 'مدينة', 'منطقة'
+    ]),
+    ('types', ['فئة المنشأة', 'نوع', 'type', 'فئة', 'category', 'تصنيف']),
+    ('statuses', ['حالة', 'status', 'موقف', 'قائمة', 'بيضاء', 'نتيجة']),
+    ('dates', ['تاريخ', 'date', 'وقت', 'time']),
+]
+
+# جميع التصنيفات مع أسمائها المعروضة
+CATEGORY_LABELS = {
+    'codes': 'أكواد',
+    'names': 'أسماء',
+    'addresses': 'عناوين',
+    'types': 'أنواع',
+    'statuses': 'حالات',
+    'dates': 'تواريخ',
+    'other': 'أخرى'
+}
+
+# أسماء أعمدة الكود المتوقعة بالترتيب
+SEARCH_COLUMN_CANDIDATES = [
+    'الكود المنشأة', 'الكود الجديد', 'الكود', 'كود', 'رقم', 'ID', 'Code', 'code',
+    'كود المنشأة', 'رقم المنشأة'
+]
+
+# أعمدة البحث النصي المرتب حسب الصلة
+RANKED_SEARCH_COLUMNS = [
+    'اسم المنشأة بالبطاقة الضريبية',
+    'اسم المنشأة على اللافتة',
+    'عنوان المنشأة (المحافظة)',
+    'عنوان المنشأة (المنطقة / المدينة)',
+    'عنوان المنشأة (تفصيلياً)'
+]
+
+# تعبير منتظم واحد لكل تصنيف بدلاً من المرور على الكلمات المفتاحية لكل عمود
+_MATCHERS = [
+    (category, re.compile('|'.join(re.escape(keyword) for keyword in keywords), re.IGNORECASE))
+    for category, keywords in CATEGORY_KEYWORDS
+]
+
+
+def is_text_column(series):
+    """هل العمود نصي (نصوص Python أو Arrow) وليس فئات أو أرقاماً"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return False
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+def classify_column(column):
+    """تصنيف عمود واحد حسب اسمه"""
+    if column in SPECIFIC_COLUMNS:
+        return SPECIFIC_COLUMNS[column]
+    for category, matcher in _MATCHERS:
+        if matcher.search(column):
+            return category
+    return 'other'
+
+
+class ResolvedSchema:
+    """تصنيف الأعمدة وعمود البحث لنسخة واحدة من البيانات
+
+    يُحسب مرة واحدة لكل نسخة ولكل تخصيص يختاره المستخدم، ويُقرأ في جميع
+    التبويبات وعند بناء البطاقات بدلاً من إعادة تصنيف الأعمدة في كل تشغيل.
+    """
+
+    def __init__(self, columns, text_columns=(), category_overrides=None, search_column=None):
+        self.columns = list(columns)
+        self.category_overrides = dict(category_overrides or {})
+        self.category_of = {
+            col: self.category_overrides.get(col) or classify_column(col) for col in self.columns
+        }
+        self.categories = {category: [] for category in CATEGORY_LABELS}
+        for col in self.columns:
+            self.categories[self.category_of[col]].append(col)
+
+        self.search_column_overridden = search_column in self.category_of
+        if self.search_column_overridden:
+            self.search_column = search_column
+        else:
+            self.search_column = self._best_search_column(text_columns)
+
+        self.required_found = [col for col in REQUIRED_COLUMNS if col in self.category_of]
+        self.text_search_columns = tuple(dict.fromkeys(
+            [self.search_column] + self.categories['names'] + self.categories['addresses']
+        ))
+        self.ranked_search_columns = tuple(
+            [col for col in RANKED_SEARCH_COLUMNS if col in self.category_of]
+            or self.categories['names'] + self.categories['addresses']
+        )
+        # مفتاح يميز التخصيص (للبطاقات المحفوظة مثلاً)
+        self.key = (tuple(sorted(self.category_overrides.items())), self.search_column)
+
+    def __getitem__(self, category):
+        """أعمدة التصنيف المطلوب"""
+        return self.categories[category]
+
+    def __contains__(self, column):
+        """هل العمود موجود في البيانات"""
+        return column in self.category_of
+
+    def _best_search_column(self, text_columns):
+        """العثور على أفضل عمود للبحث بناءً على الأعمدة المتوقعة"""
+        for col in SEARCH_COLUMN_CANDIDATES:
+            if col in self.category_of:
+                return col
+        # إذا لم نجد أي عمود من القائمة، نستخدم أول عمود نصي ثم أول عمود
+        if text_columns:
+            return text_columns[0]
+        return self.columns[0] if self.columns else None
+
+
+def resolve_schema(data, category_overrides=None, search_column=None):
+    """تصنيف أعمدة الجدول مع تطبيق تخصيص المستخدم إن وجد"""
+    text_columns = [col for col in data.columns if is_text_column(data[col])]
+    return ResolvedSchema(data.columns, text_columns, category_overrides, search_column)
+
+
+def align_columns(frames):
+    """توحيد أسماء أعمدة عدة جداول (ملف لكل مديرية) على أعمدة الجدول الأول
+
+    الأعمدة بنفس الاسم تبقى كما هي، وعمود الكود يأخذ اسم عمود الكود في الجدول
+    الأول، وباقي الأعمدة المختلفة تُطابق بترتيبها داخل نفس التصنيف إذا تساوى
+    عددها في الجدولين. العمود الذي لا يُطابق يبقى عموداً مستقلاً.
+    """
+    if not frames:
+        return []
+    reference = resolve_schema(frames[0])
+    aligned = [frames[0]]
+    for data in frames[1:]:
+        schema = resolve_schema(data)
+        renames = {}
+        if (schema.search_column is not None and reference.search_column is not None
+                and schema.search_column not in reference and reference.search_column not in schema):
+            renames[schema.search_column] = reference.search_column
+        for category, columns in schema.categories.items():
+            if category == 'other':
+                continue
+            unmatched = [col for col in columns if col not in reference and col not in renames]
+            missing = [col for col in reference[category] if col not in schema and col not in renames.values()]
+            if unmatched and len(unmatched) == len(missing):
+                renames.update(zip(unmatched, missing))
+        aligned.append(data.rename(columns=renames))
+    return aligned
+
@@ -0,0 +1,863 @@
+"""فهارس البحث في بيانات المنشآت الغذائية
+
+جميع الفهارس تحفظ معرّفات الصفوف (فهرس الجدول) وليس مواقعها، حتى يمكن
+تحديثها عند تغير بعض الصفوف فقط دون إعادة بنائها بالكامل.
+"""
+import copy
+import heapq
+import math
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from arabic_text import normalize_arabic, tokenize
+
+# أوضاع البحث المتاحة
+MODE_CODE = 'code'          # مطابقة تامة ثم البحث ببداية الكود
+MODE_CONTAINS = 'contains'  # البحث عن جزء من الكود أو الاسم أو العنوان
+MODE_RANKED = 'ranked'      # بحث بالكلمات في الأسماء والعناوين مرتب حسب الصلة
+
+# طول المقاطع المستخدمة في فهرس البحث الجزئي
+NGRAM_SIZE = 3
+# فاصل بين نصوص الأعمدة المختلفة في نفس الصف
+_COLUMN_SEPARATOR = '\x00'
+# أكبر عدد من القيم التي تُحسب مسافتها الكاملة عن النص المدخل في اقتراح واحد
+MAX_FUZZY_CANDIDATES = 500
+
+# أكبر حرف يونيكود لتحديد نهاية نطاق البادئة
+_PREFIX_END = '\U0010ffff'
+
+
+def normalize_text(value):
+    """تحويل القيمة إلى نص عربي موحد بدون تشكيل أو مسافات زائدة"""
+    if value is None:
+        return ''
+    try:
+        if pd.isna(value):
+            return ''
+    except (TypeError, ValueError):
+        pass
+    return normalize_arabic(str(value))
+
+
+def normalize_code(value):
+    """توحيد شكل الكود قبل الفهرسة أو البحث"""
+    text = normalize_text(value)
+    # الأكواد الرقمية قد تُقرأ كأرقام عشرية من ملف CSV مثل 1234.0
+    if text.endswith('.0') and text[:-2].isdigit():
+        text = text[:-2]
+    return text
+
+
+def _default_labels(columns_values):
+    """معرّفات افتراضية للصفوف (0، 1، 2، ...) عند عدم تحديدها"""
+    return range(len(columns_values[0])) if columns_values else range(0)
+
+
+def _without(values, item):
+    """نسخة من القائمة بدون العنصر المحدد (لا تعدل القائمة الأصلية)"""
+    return [value for value in values if value != item]
+
+
+def _owned_copy(mapping, key, owned, factory=list):
+    """نسخ قائمة (أو قاموس) داخل الفهرس الجديد مرة واحدة فقط لكل تحديث"""
+    if key not in owned:
+        mapping[key] = factory(mapping.get(key, ()))
+        owned.add(key)
+    return mapping[key]
+
+
+def _discard_sorted(values, item):
+    """حذف عنصر من قائمة مرتبة إذا كان موجوداً"""
+    i = bisect_left(values, item)
+    if i < len(values) and values[i] == item:
+        del values[i]
+
+
+def _with_sorted(values, item):
+    """نسخة مرتبة من القائمة بعد إضافة العنصر (لا تعدل القائمة الأصلية)"""
+    values = list(values)
+    insort(values, item)
+    return values
+
+
+class CodeIndex:
+    """فهرس عمود الكود: قاموس للمطابقة التامة ومصفوفة مرتبة للبحث بالبداية"""
+
+    def __init__(self, values, labels=None):
+        if labels is None:
+            labels = range(len(values))
+        self.keys = {}
+        self.labels_by_key = {}
+        self.sorted_keys = []
+        self.extend(values, labels)
+
+    def extend(self, values, labels):
+        """إضافة دفعة صفوف إلى نفس الفهرس (أثناء بنائه من ملف يُقرأ على دفعات فقط)"""
+        touched = set()
+        new_keys = []
+        for label, value in zip(labels, values):
+            key = normalize_code(value)
+            self.keys[label] = key
+            if not key:
+                continue
+            key_labels = self.labels_by_key.get(key)
+            if key_labels is None:
+                key_labels = self.labels_by_key[key] = []
+                new_keys.append(key)
+            key_labels.append(label)
+            touched.add(key)
+        for key in touched:
+            self.labels_by_key[key].sort()
+        self.sorted_keys = list(heapq.merge(self.sorted_keys, sorted(new_keys)))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def updated(self, removed_labels, removed_columns, added_labels, added_columns):
+        """نسخة جديدة من الفهرس بعد حذف وإضافة الصفوف المتغيرة فقط"""
+        # النسخة تشارك القوائم غير المتغيرة مع الفهرس القديم ولا تعدلها
+        index = copy.copy(self)
+        index.keys = dict(self.keys)
+        index.labels_by_key = dict(self.labels_by_key)
+        index.sorted_keys = list(self.sorted_keys)
+        for label in removed_labels:
+            key = index.keys.pop(label, '')
+            if not key:
+                continue
+            remaining = _without(index.labels_by_key[key], label)
+            if remaining:
+                index.labels_by_key[key] = remaining
+            else:
+                del index.labels_by_key[key]
+                del index.sorted_keys[bisect_left(index.sorted_keys, key)]
+        for label, value in zip(added_labels, added_columns[0]):
+            key = normalize_code(value)
+            index.keys[label] = key
+            if not key:
+                continue
+            labels = index.labels_by_key.get(key)
+            if labels:
+                index.labels_by_key[key] = _with_sorted(labels, label)
+            else:
+                index.labels_by_key[key] = [label]
+                insort(index.sorted_keys, key)
+        return index
+
+    def exact(self, term):
+        """إرجاع معرّفات الصفوف التي يطابق كودها القيمة تماماً"""
+        return list(self.labels_by_key.get(normalize_code(term), []))
+
+    def prefix(self, term):
+        """إرجاع معرّفات الصفوف التي يبدأ كودها بالقيمة المدخلة"""
+        key = normalize_code(term)
+        if not key:
+            return []
+        start = bisect_left(self.sorted_keys, key)
+        end = bisect_left(self.sorted_keys, key + _PREFIX_END, lo=start)
+        labels = []
+        for matched_key in self.sorted_keys[start:end]:
+            labels.extend(self.labels_by_key[matched_key])
+        labels.sort()
+        return labels
+
+    def lookup(self, term):
+        """البحث بالمطابقة التامة أولاً ثم ببداية الكود"""
+        labels = self.exact(term)
+        if labels:
+            return labels
+        return self.prefix(term)
+
+
+def _ngrams(text):
+    """استخراج المقاطع الثلاثية من النص"""
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def _sorted_contains(values, value):
+    """التحقق من وجود قيمة في قائمة مرتبة باستخدام البحث الثنائي"""
+    i = bisect_left(values, value)
+    return i < len(values) and values[i] == value
+
+
+class TrigramIndex:
+    """فهرس مقاطع ثلاثية للبحث عن جزء من النص في عدة أعمدة"""
+
+    def __init__(self, columns_values, labels=None, code_columns=1):
+        # الأعمدة الأولى (بعدد code_columns) تعامل كأكواد والباقي كنصوص
+        self.code_columns = code_columns
+        if labels is None:
+            labels = _default_labels(columns_values)
+        self.texts = {}
+        self.postings = {}
+        self.extend(columns_values, labels)
+
+    def extend(self, columns_values, labels):
+        """إضافة دفعة صفوف إلى نفس الفهرس (أثناء بنائه من ملف يُقرأ على دفعات فقط)"""
+        touched = set()
+        for label, parts in zip(labels, self._normalized_rows(columns_values)):
+            self.texts[label] = _COLUMN_SEPARATOR.join(parts)
+            grams = self._row_grams(parts)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(label)
+            touched.update(grams)
+        # قوائم المعرّفات يجب أن تكون مرتبة للتقاطع بالبحث الثنائي
+        for gram in touched:
+            self.postings[gram].sort()
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _normalized_rows(self, columns_values):
+        """توحيد نصوص الأعمدة وإرجاعها صفاً صفاً"""
+        normalized_columns = []
+        for column_position, values in enumerate(columns_values):
+            normalize = normalize_code if column_position < self.code_columns else normalize_text
+            normalized_columns.append([normalize(value) for value in values])
+        return zip(*normalized_columns)
+
+    @staticmethod
+    def _row_grams(parts):
+        """جميع المقاطع الثلاثية في أعمدة الصف"""
+        grams = set()
+        for part in parts:
+            grams.update(_ngrams(part))
+        return grams
+
+    def updated(self, removed_labels, removed_columns, added_labels, added_columns):
+        """نسخة جديدة من الفهرس بعد حذف وإضافة الصفوف المتغيرة فقط"""
+        index = copy.copy(self)
+        index.texts = dict(self.texts)
+        index.postings = dict(self.postings)
+        owned = set()
+        for label in removed_labels:
+            text = index.texts.pop(label, None)
+            if text is None:
+                continue
+            for gram in self._row_grams(text.split(_COLUMN_SEPARATOR)):
+                posting = _owned_copy(index.postings, gram, owned)
+                _discard_sorted(posting, label)
+        for label, parts in zip(added_labels, self._normalized_rows(added_columns)):
+            index.texts[label] = _COLUMN_SEPARATOR.join(parts)
+            for gram in self._row_grams(parts):
+                insort(_owned_copy(index.postings, gram, owned), label)
+        for gram in owned:
+            if not index.postings[gram]:
+                del index.postings[gram]
+        return index
+
+    def candidates(self, key):
+        """تقاطع قوائم المقاطع للحصول على الصفوف المرشحة"""
+        posting_lists = []
+        for gram in _ngrams(key):
+            posting = self.postings.get(gram)
+            if not posting:
+                return []
+            posting_lists.append(posting)
+        posting_lists.sort(key=len)
+        result = posting_lists[0]
+        for posting in posting_lists[1:]:
+            result = [label for label in result if _sorted_contains(posting, label)]
+            if not result:
+                break
+        return result
+
+    def search(self, term):
+        """إرجاع معرّفات الصفوف التي يحتوي أحد أعمدتها على النص المدخل"""
+        key = normalize_text(term)
+        if not key:
+            return []
+        if len(key) < NGRAM_SIZE:
+            # النصوص القصيرة لا تكوّن مقاطع فيتم التحقق من جميع الصفوف
+            return sorted(label for label, text in self.texts.items() if key in text)
+        return [label for label in self.candidates(key) if key in self.texts[label]]
+
+
+class BM25Index:
+    """فهرس كلمات مرتب حسب الصلة (BM25) على أعمدة الأسماء والعناوين"""
+
+    def __init__(self, columns_values, labels=None, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        if labels is None:
+            labels = _default_labels(columns_values)
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.postings = {}
+        for label, term_counts in zip(labels, self._term_counts(columns_values)):
+            self.doc_lengths[label] = sum(term_counts.values())
+            self.total_length += self.doc_lengths[label]
+            for token, count in term_counts.items():
+                self.postings.setdefault(token, {})[label] = count
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @staticmethod
+    def _term_counts(columns_values):
+        """عدد مرات تكرار كل كلمة في كل صف"""
+        for parts in zip(*columns_values):
+            term_counts = {}
+            for part in parts:
+                for token in tokenize(normalize_text(part)):
+                    term_counts[token] = term_counts.get(token, 0) + 1
+            yield term_counts
+
+    def updated(self, removed_labels, removed_columns, added_labels, added_columns):
+        """نسخة جديدة من الفهرس بعد حذف وإضافة الصفوف المتغيرة فقط"""
+        index = copy.copy(self)
+        index.doc_lengths = dict(self.doc_lengths)
+        index.postings = dict(self.postings)
+        owned = set()
+        for label, term_counts in zip(removed_labels, self._term_counts(removed_columns)):
+            if label not in index.doc_lengths:
+                continue
+            index.total_length -= index.doc_lengths.pop(label)
+            for token in term_counts:
+                _owned_copy(index.postings, token, owned, dict).pop(label, None)
+        for label, term_counts in zip(added_labels, self._term_counts(added_columns)):
+            index.doc_lengths[label] = sum(term_counts.values())
+            index.total_length += index.doc_lengths[label]
+            for token, count in term_counts.items():
+                _owned_copy(index.postings, token, owned, dict)[label] = count
+        for token in owned:
+            if not index.postings[token]:
+                del index.postings[token]
+        return index
+
+    def search(self, term, top_k=None):
+        """إرجاع معرّفات الصفوف المطابقة مرتبة تنازلياً حسب الدرجة
+
+        بدون top_k تُرجع جميع الصفوف المطابقة حتى يكون عدد النتائج والتصفية
+        حسب المحافظة أو الفئة على جميع المطابقات وليس على أفضلها فقط.
+        """
+        tokens = set(tokenize(normalize_text(term)))
+        if not tokens or not self.total_length:
+            return []
+        total_docs = len(self.doc_lengths)
+        average_length = self.total_length / total_docs
+        scores = {}
+        for token in tokens:
+            posting = self.postings.get(token)
+            if not posting:
+                continue
+            idf = math.log(1 + (total_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for label, count in posting.items():
+                length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[label] / average_length)
+                scores[label] = scores.get(label, 0.0) + idf * count * (self.k1 + 1) / (count + length_norm)
+        rank = lambda item: (item[1], -item[0])
+        if top_k is None:
+            best = sorted(scores.items(), key=rank, reverse=True)
+        else:
+            best = heapq.nlargest(top_k, scores.items(), key=rank)
+        return [label for label, _ in best]
+
+
+def edit_distance(source, target, max_distance):
+    """حساب مسافة التحرير (مع تبديل الحرفين المتجاورين) مع التوقف عند تجاوز الحد"""
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        for j in range(1, len(target) + 1):
+            cost = 0 if source[i - 1] == target[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and source[i - 1] == target[j - 2] and source[i - 2] == target[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _single_deletes(text):
+    """جميع النصوص الناتجة عن حذف حرف واحد"""
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+class FuzzyIndex:
+    """قاموس حذف مسبق (بأسلوب SymSpell) لاقتراح أقرب القيم عند الخطأ الإملائي
+
+    القاموس مبني على كلمات القيم وليس على بداية القيمة كاملة، لأن أسماء
+    المنشآت تشترك غالباً في بدايتها ("مطعم ال"). كل كلمة في القيمة القريبة
+    قريبة من الكلمة المقابلة في النص المدخل، فتُحسب المسافة الكاملة فقط للقيم
+    التي تحتوي كلمة قريبة من أندر كلمات النص المدخل.
+    """
+
+    def __init__(self, values, normalize=normalize_text, max_distance=2, prefix_length=7,
+                 max_candidates=MAX_FUZZY_CANDIDATES):
+        self.normalize = normalize
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.max_candidates = max_candidates
+        self.terms = []
+        self.display = []
+        self.term_ids = {}
+        self.term_counts = {}
+        # معرّفات المصطلحات التي تحتوي كل كلمة
+        self.postings = {}
+        # الكلمات المسجلة تحت كل صيغة حذف
+        self.deletes = {}
+        for value in values:
+            term = normalize(value)
+            if not term:
+                continue
+            term_id = self.term_ids.get(term)
+            if term_id is not None:
+                self.term_counts[term_id] += 1
+                continue
+            term_id = self._new_term(term, value)
+            for word in set(term.split()):
+                posting = self.postings.get(word)
+                if posting is None:
+                    # كل كلمة جديدة تسجل تحت جميع صيغ الحذف لبدايتها
+                    posting = self.postings[word] = []
+                    for variant in self._variants(word):
+                        self.deletes.setdefault(variant, []).append(word)
+                posting.append(term_id)
+
+    def __len__(self):
+        return len(self.term_ids)
+
+    def _variants(self, term):
+        """صيغ الحذف لبداية الكلمة حتى المسافة القصوى"""
+        variants = {term[:self.prefix_length]}
+        frontier = set(variants)
+        for _ in range(self.max_distance):
+            frontier = {deleted for text in frontier for deleted in _single_deletes(text)}
+            variants |= frontier
+        return variants
+
+    def _new_term(self, term, value):
+        """تسجيل مصطلح جديد وإرجاع معرّفه"""
+        term_id = len(self.terms)
+        self.term_ids[term] = term_id
+        self.term_counts[term_id] = 1
+        self.terms.append(term)
+        self.display.append(str(value).strip())
+        return term_id
+
+    def updated(self, removed_labels, removed_columns, added_labels, added_columns):
+        """نسخة جديدة من القاموس بعد حذف وإضافة القيم المتغيرة فقط"""
+        index = copy.copy(self)
+        index.terms = list(self.terms)
+        index.display = list(self.display)
+        index.term_ids = dict(self.term_ids)
+        index.term_counts = dict(self.term_counts)
+        index.postings = dict(self.postings)
+        index.deletes = dict(self.deletes)
+        owned = set()
+        owned_postings = set()
+        for values in removed_columns:
+            for value in values:
+                term = index.normalize(value)
+                term_id = index.term_ids.get(term) if term else None
+                if term_id is None:
+                    continue
+                index.term_counts[term_id] -= 1
+                if index.term_counts[term_id] > 0:
+                    continue
+                del index.term_counts[term_id]
+                del index.term_ids[term]
+                # يبقى المعرّف محجوزاً حتى لا تتغير معرّفات باقي المصطلحات
+                index.terms[term_id] = None
+                for word in set(term.split()):
+                    _owned_copy(index.postings, word, owned_postings).remove(term_id)
+        for values in added_columns:
+            for value in values:
+                term = index.normalize(value)
+                if not term:
+                    continue
+                term_id = index.term_ids.get(term)
+                if term_id is not None:
+                    index.term_counts[term_id] += 1
+                    continue
+                term_id = index._new_term(term, value)
+                for word in set(term.split()):
+                    if word not in index.postings:
+                        for variant in index._variants(word):
+                            _owned_copy(index.deletes, variant, owned).append(word)
+                    _owned_copy(index.postings, word, owned_postings).append(term_id)
+        # الكلمات التي لم تعد في أي مصطلح تُحذف من القاموس بعد انتهاء التحديث
+        for word in owned_postings:
+            if not index.postings[word]:
+                del index.postings[word]
+                for variant in index._variants(word):
+                    _owned_copy(index.deletes, variant, owned).remove(word)
+        for variant in owned:
+            if not index.deletes[variant]:
+                del index.deletes[variant]
+        return index
+
+    def suggest(self, term, max_distance=None, limit=5):
+        """إرجاع أقرب القيم للنص المدخل على شكل (القيمة، المسافة)"""
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = min(max_distance, self.max_distance)
+        key = normalize_text(term)
+        if not key:
+            return []
+        # نبدأ بأقل مسافة ولا نوسع البحث إلا إذا لم نجد اقتراحات
+        for distance in range(max_distance + 1):
+            matches = self._lookup(key, distance)
+            if matches:
+                break
+        best = sorted(matches.items(), key=lambda item: (item[1], self.terms[item[0]]))[:limit]
+        return [(self.display[term_id], distance) for term_id, distance in best]
+
+    def _similar_words(self, word, max_distance):
+        """كلمات القاموس ضمن المسافة المحددة من الكلمة"""
+        word_prefix = word[:self.prefix_length]
+        similar = []
+        checked = set()
+        considered = {word_prefix}
+        queue = [word_prefix]
+        while queue:
+            candidate = queue.pop()
+            for known in self.deletes.get(candidate, ()):
+                if known in checked:
+                    continue
+                checked.add(known)
+                if edit_distance(word, known, max_distance) <= max_distance:
+                    similar.append(known)
+            if len(word_prefix) - len(candidate) < max_distance:
+                for deleted in _single_deletes(candidate):
+                    if deleted not in considered:
+                        considered.add(deleted)
+                        queue.append(deleted)
+        return similar
+
+    def _candidates(self, key, max_distance):
+        """المصطلحات التي تحتوي كلمة قريبة من أندر كلمات النص المدخل"""
+        words = sorted(set(key.split()), key=len, reverse=True)
+        # الكلمات القصيرة جداً قريبة من أغلب الكلمات فلا تُستخدم إلا إذا لم يوجد غيرها
+        words = [word for word in words if len(word) > max_distance] or words
+        best = None
+        for word in words:
+            candidates = set()
+            for similar in self._similar_words(word, max_distance):
+                candidates.update(self.postings[similar])
+            if best is None or len(candidates) < len(best):
+                best = candidates
+            # الكلمات الأطول أندر غالباً، والعدد الصغير يكفي دون فحص باقي الكلمات
+            if len(best) <= self.max_candidates:
+                break
+        return best
+
+    def _lookup(self, key, max_distance):
+        """البحث في قاموس الحذف عن المصطلحات ضمن المسافة المحددة"""
+        candidates = sorted(
+            term_id for term_id in self._candidates(key, max_distance)
+            if abs(len(self.terms[term_id]) - len(key)) <= max_distance
+        )
+        matches = {}
+        for term_id in candidates[:self.max_candidates]:
+            distance = edit_distance(key, self.terms[term_id], max_distance)
+            if distance <= max_distance:
+                matches[term_id] = distance
+        return matches
+
+
+class PrefixIndex:
+    """اقتراحات الإكمال التلقائي من بداية القيم مرتبة حسب عدد الصفوف
+
+    كل قيمة موحدة تُسجل تحت بدايتها (وبداية كل كلمة فيها للأسماء) في مصفوفة
+    مرتبة، فتقع جميع القيم التي تبدأ بنص معين في مدى متصل يُحدد ببحث ثنائي.
+    معرّف كل قيمة ثابت ومحفوظ بجانبها، وعدد صفوفها في مصفوفة حسب المعرّف،
+    فيُختار أكثرها صفوفاً من المدى دون ترتيبه بالكامل، ولا يُعاد ترتيب
+    المصفوفة عند تحديث عدد الصفوف.
+    """
+
+    def __init__(self, values, normalize=normalize_text, word_starts=False):
+        self.normalize = normalize
+        self.word_starts = word_starts
+        self.counts = {}
+        self.display = {}
+        self._count(values, 1)
+        self._build()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _count(self, values, step):
+        """إضافة القيم إلى عدد الصفوف (أو طرحها عند step = -1)"""
+        for value in values:
+            term = self.normalize(value)
+            if not term:
+                continue
+            count = self.counts.get(term, 0) + step
+            if count > 0:
+                self.counts[term] = count
+                self.display.setdefault(term, str(value).strip())
+            else:
+                self.counts.pop(term, None)
+                self.display.pop(term, None)
+
+    def _starts(self, term):
+        """النصوص التي تُسجل القيمة تحتها: القيمة كاملة وبداية كل كلمة فيها"""
+        if not self.word_starts:
+            return [term]
+        return [term[i:] for i in range(len(term)) if i == 0 or (term[i - 1] == ' ' and term[i] != ' ')]
+
+    def _build(self):
+        """بناء المصفوفة المرتبة ومعرّفات القيم وعدد صفوفها"""
+        self.terms = list(self.counts)
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+        self.term_counts = np.fromiter(
+            (self.counts[term] for term in self.terms), dtype=np.int64, count=len(self.terms)
+        )
+        entries = sorted(
+            (start, term_id) for term_id, term in enumerate(self.terms) for start in self._starts(term)
+        )
+        self.keys = [start for start, _ in entries]
+        self.ids = np.fromiter((term_id for _, term_id in entries), dtype=np.int64, count=len(entries))
+
+    def updated(self, removed_labels, removed_columns, added_labels, added_columns):
+        """نسخة جديدة بعد تعديل عدد صفوف القيم المتغيرة وإدراج القيم الجديدة فقط
+
+        القيمة التي لم تعد في أي صف تبقى في المصفوفة بعدد صفوف صفر (وتعود
+        لنفس مكانها إذا أُضيفت مرة أخرى)، ويُعاد البناء فقط عندما يزيد عدد هذه
+        القيم على عدد القيم الموجودة.
+        """
+        index = copy.copy(self)
+        index.counts = dict(self.counts)
+        index.display = dict(self.display)
+        for values in removed_columns:
+            index._count(values, -1)
+        for values in added_columns:
+            index._count(values, 1)
+        changed = {
+            index.normalize(value) for values in list(removed_columns) + list(added_columns) for value in values
+        }
+        changed.discard('')
+        new_terms = sorted(term for term in changed if term not in self.term_ids and term in index.counts)
+        if len(self.terms) + len(new_terms) > 2 * max(1, len(index.counts)):
+            index._build()
+            return index
+
+        index.terms = self.terms + new_terms
+        index.term_ids = dict(self.term_ids)
+        index.term_ids.update((term, len(self.terms) + i) for i, term in enumerate(new_terms))
+        index.term_counts = np.zeros(len(index.terms), dtype=np.int64)
+        index.term_counts[:len(self.terms)] = self.term_counts
+        for term in changed:
+            index.term_counts[index.term_ids[term]] = index.counts.get(term, 0)
+
+        # إدراج بدايات القيم الجديدة في مواقعها من المصفوفة المرتبة بدلاً من ترتيبها كاملة
+        entries = sorted((start, index.term_ids[term]) for term in new_terms for start in index._starts(term))
+        positions = [bisect_left(self.keys, start) for start, _ in entries]
+        keys = []
+        previous = 0
+        for position, (start, _) in zip(positions, entries):
+            keys.extend(self.keys[previous:position])
+            keys.append(start)
+            previous = position
+        keys.extend(self.keys[previous:])
+        index.keys = keys
+        index.ids = np.insert(self.ids, positions, [term_id for _, term_id in entries])
+        return index
+
+    def complete(self, term, limit=5):
+        """إرجاع أكثر القيم صفوفاً التي تبدأ بالنص المدخل على شكل (القيمة، عدد الصفوف)"""
+        key = self.normalize(term)
+        if not key:
+            return []
+        start = bisect_left(self.keys, key)
+        end = bisect_left(self.keys, key + _PREFIX_END, lo=start)
+        ids = self.ids[start:end]
+        counts = self.term_counts[ids]
+        ids, counts = ids[counts > 0], counts[counts > 0]
+        # الأكثر صفوفاً أولاً، ثم ترتيب البدايات عند تساوي عدد الصفوف
+        order = np.arange(len(ids)) - counts * len(ids)
+        take = limit
+        while True:
+            if take < len(ids):
+                top = np.argpartition(order, take)[:take]
+                top = top[np.argsort(order[top])]
+            else:
+                top = np.argsort(order)
+            # القيمة قد تتكرر في المدى ببدايات كلمات مختلفة
+            chosen = list(dict.fromkeys(ids[top].tolist()))[:limit]
+            if len(chosen) == limit or take >= len(ids):
+                break
+            take *= 2
+        return [(self.display[self.terms[term_id]], self.counts[self.terms[term_id]]) for term_id in chosen]
+
+
+def labels_to_bits(labels):
+    """تحويل معرّفات الصفوف (أعداد صحيحة) إلى خريطة بتات: البت رقم n يعني الصف n"""
+    labels = np.asarray(labels, dtype=np.int64)
+    if not len(labels):
+        return 0
+    present = np.zeros(int(labels.max()) + 1, dtype=bool)
+    present[labels] = True
+    return int.from_bytes(np.packbits(present, bitorder='little').tobytes(), 'little')
+
+
+def bits_to_mask(bits):
+    """تحويل خريطة البتات إلى مصفوفة منطقية حسب معرّف الصف"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder='little').astype(bool)
+
+
+def _facet_value(value):
+    """القيمة المعروضة في التصفية أو None للقيم الفارغة"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return str(value).strip() or None
+
+
+class FacetIndex:
+    """خرائط بتات لكل قيمة في أعمدة التصفية (المحافظة، المدينة، الفئة، الحالة)
+
+    كل خريطة عدد صحيح يمثل البت رقم n فيه الصف ذا المعرّف n، فيكون الجمع بين
+    عوامل التصفية عمليات AND و OR على أعداد صحيحة، وعدد نتائج كل قيمة هو عدد
+    البتات في ناتج AND دون المرور على صفوف الجدول.
+    """
+
+    def __init__(self, columns_values, labels=None):
+        if labels is None:
+            labels = _default_labels(columns_values)
+        labels = [int(label) for label in labels]
+        self.all_rows = labels_to_bits(labels)
+        self.bitmaps = []
+        for values in columns_values:
+            labels_by_value = {}
+            for label, value in zip(labels, values):
+                value = _facet_value(value)
+                if value is not None:
+                    labels_by_value.setdefault(value, []).append(label)
+            self.bitmaps.append({
+                value: labels_to_bits(value_labels) for value, value_labels in labels_by_value.items()
+            })
+
+    def __len__(self):
+        return self.all_rows.bit_count()
+
+    def updated(self, removed_labels, removed_columns, added_labels, added_columns):
+        """نسخة جديدة من الفهرس بعد حذف وإضافة الصفوف المتغيرة فقط"""
+        # الأعداد الصحيحة غير قابلة للتعديل، فيكفي نسخ القواميس
+        index = copy.copy(self)
+        index.bitmaps = [dict(bitmap) for bitmap in self.bitmaps]
+        removed_labels = [int(label) for label in removed_labels]
+        added_labels = [int(label) for label in added_labels]
+        keep = ~labels_to_bits(removed_labels)
+        index.all_rows = (self.all_rows & keep) | labels_to_bits(added_labels)
+        for bitmap, values in zip(index.bitmaps, removed_columns):
+            for value in {_facet_value(value) for value in values} - {None}:
+                remaining = bitmap.get(value, 0) & keep
+                if remaining:
+                    bitmap[value] = remaining
+                else:
+                    bitmap.pop(value, None)
+        for bitmap, values in zip(index.bitmaps, added_columns):
+            labels_by_value = {}
+            for label, value in zip(added_labels, values):
+                value = _facet_value(value)
+                if value is not None:
+                    labels_by_value.setdefault(value, []).append(label)
+            for value, value_labels in labels_by_value.items():
+                bitmap[value] = bitmap.get(value, 0) | labels_to_bits(value_labels)
+        return index
+
+    def mask(self, selections, skip=None):
+        """خريطة الصفوف المطابقة لجميع عوامل التصفية (OR داخل العمود و AND بين الأعمدة)
+
+        selections قائمة بالقيم المختارة لكل عمود (القائمة الفارغة تعني بدون تصفية)،
+        و skip رقم عمود يُتجاهل اختياره عند حساب أعداد قيمه.
+        """
+        bits = self.all_rows
+        for position, (bitmap, selected) in enumerate(zip(self.bitmaps, selections)):
+            if position == skip or not selected:
+                continue
+            column_bits = 0
+            for value in selected:
+                column_bits |= bitmap.get(value, 0)
+            bits &= column_bits
+        return bits
+
+    def counts(self, position, base):
+        """عدد الصفوف لكل قيمة في العمود ضمن خريطة الأساس (بدون القيم الصفرية)"""
+        counts = {}
+        for value, bits in self.bitmaps[position].items():
+            count = (bits & base).bit_count()
+            if count:
+                counts[value] = count
+        return counts
+
+    def labels(self, bits):
+        """معرّفات الصفوف في خريطة البتات بالترتيب"""
+        return np.flatnonzero(bits_to_mask(bits)).tolist()
+
+    def filter(self, labels, bits):
+        """الصفوف الموجودة في خريطة البتات مع الحفاظ على ترتيب القائمة (ترتيب الصلة)"""
+        present = bits_to_mask(bits)
+        return [label for label in labels if label < len(present) and present[label]]
+
+
+class QueryCache:
+    """ذاكرة مؤقتة محدودة الحجم (LRU) لنتائج البحث مشتركة بين جميع الجلسات
+
+    المفاتيح على شكل (طريقة البحث، الأعمدة، النص الموحد) لنسخة واحدة من
+    البيانات، والنتيجة مصفوفة معرّفات صفوف للقراءة فقط. تُفرغ الذاكرة تلقائياً
+    عند أول طلب لنسخة مختلفة من البيانات.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def _use_version(self, version):
+        """تفريغ الذاكرة إذا كان الطلب لنسخة مختلفة من البيانات"""
+        if version != self.version:
+            self.version = version
+            self._results.clear()
+
+    def get_or_search(self, version, key, search):
+        """إرجاع النتيجة المحفوظة أو تنفيذ البحث وحفظ نتيجته"""
+        with self._lock:
+            self._use_version(version)
+            labels = self._results.get(key)
+            if labels is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return labels
+            self.misses += 1
+        labels = np.asarray(search(), dtype=np.int64)
+        labels.flags.writeable = False
+        with self._lock:
+            # لا نحفظ نتيجة نسخة قديمة إذا وصلت نسخة جديدة أثناء البحث
+            if version == self.version:
+                self._results[key] = labels
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+                    self.evictions += 1
+        return labels
+
+    def stats(self):
+        """عدد النتائج المحفوظة ومرات الإصابة والإخفاق والحذف"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._results),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }